@@ -1,22 +1,38 @@
 import sys
 import requests
+import requests.adapters
+import urllib3
+import socket
 import json
 import subprocess
 import platform
 import os
-import base64
 import re
 import shutil
+import time
+import sqlite3
+import hashlib
+import base64
+import math
+import threading
+from contextlib import closing
+try:
+    import numpy as np
+except ImportError:
+    # Only needed for remembering pages
+    np = None
 from io import BytesIO
-from PyQt6.QtCore import QUrl, Qt, QThread, pyqtSignal, QBuffer, QPropertyAnimation, QEasingCurve, QSize, QTimer, QStandardPaths
+from PyQt6.QtCore import QUrl, Qt, QObject, QThread, QThreadPool, QRunnable, pyqtSignal, QBuffer, QByteArray, QPropertyAnimation, QEasingCurve, QSize, QTimer, QStandardPaths, QSettings
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QLineEdit, QPushButton, QTextEdit, 
                              QSplitter, QLabel, QComboBox, QMessageBox, QProgressDialog,
                              QTabWidget, QToolButton, QMenu, QFileDialog, QProgressBar,
                              QDialog, QListWidget, QListWidgetItem)
 from PyQt6.QtWebEngineWidgets import QWebEngineView
-from PyQt6.QtWebEngineCore import QWebEngineProfile, QWebEngineDownloadRequest
-from PyQt6.QtGui import QImage, QPainter, QAction, QIcon, QDesktopServices
+from PyQt6.QtWebEngineCore import QWebEngineProfile, QWebEngineDownloadRequest, QWebEnginePage
+from PyQt6.QtGui import (QImage, QImageWriter, QAction, QIcon, QDesktopServices, QColor,
+                         QTextCharFormat, QTextCursor, QTextFrameFormat, QTextBlockFormat, QTextListFormat,
+                         QTextTableFormat)
 
 class DownloadManager(QDialog):
     """Dialog to show active and completed downloads"""
@@ -156,91 +172,2140 @@ class DownloadManager(QDialog):
         QDesktopServices.openUrl(QUrl.fromLocalFile(downloads_path))
 
 
+class ModelDownloadManager(QDialog):
+    """Dialog that pulls Ollama models in the background, one after another"""
+    model_pulled = pyqtSignal(str)
+    pull_failed = pyqtSignal(str, str)
+    
+    def __init__(self, client, parent=None):
+        super().__init__(parent)
+        self.client = client
+        self.setWindowTitle("Model Downloads")
+        self.setGeometry(250, 250, 700, 400)
+        
+        layout = QVBoxLayout(self)
+        
+        # Header
+        header = QLabel("Model Downloads")
+        header.setStyleSheet("font-size: 16px; font-weight: bold; padding: 10px;")
+        layout.addWidget(header)
+        
+        # Pulls list
+        self.pulls_list = QListWidget()
+        layout.addWidget(self.pulls_list)
+        
+        # Buttons
+        btn_layout = QHBoxLayout()
+        
+        self.clear_btn = QPushButton("Clear Finished")
+        self.clear_btn.clicked.connect(self.clear_finished)
+        btn_layout.addWidget(self.clear_btn)
+        
+        btn_layout.addStretch()
+        
+        self.close_btn = QPushButton("Close")
+        self.close_btn.clicked.connect(self.close)
+        btn_layout.addWidget(self.close_btn)
+        
+        layout.addLayout(btn_layout)
+        
+        self.pulls = []  # Store pull info, in queue order
+        self.active = None
+    
+    def queue_pull(self, model_name):
+        """Queue a model for download, returns False if it is already queued"""
+        for pull_info in self.pulls:
+            if pull_info['model'] == model_name and not pull_info['finished']:
+                return False
+        
+        # Create widget for this pull
+        item = QListWidgetItem()
+        widget = QWidget()
+        widget_layout = QVBoxLayout(widget)
+        widget_layout.setContentsMargins(5, 5, 5, 5)
+        
+        # Model name and cancel button
+        top_layout = QHBoxLayout()
+        name_label = QLabel(f"🧠 {model_name}")
+        name_label.setStyleSheet("font-weight: bold;")
+        top_layout.addWidget(name_label)
+        top_layout.addStretch()
+        cancel_btn = QPushButton("Cancel")
+        top_layout.addWidget(cancel_btn)
+        widget_layout.addLayout(top_layout)
+        
+        # Progress bar
+        progress = QProgressBar()
+        progress.setMinimum(0)
+        progress.setMaximum(100)
+        progress.setValue(0)
+        widget_layout.addWidget(progress)
+        
+        # Status label
+        status_label = QLabel("Queued")
+        widget_layout.addWidget(status_label)
+        
+        item.setSizeHint(widget.sizeHint())
+        self.pulls_list.addItem(item)
+        self.pulls_list.setItemWidget(item, widget)
+        
+        # Store references
+        pull_info = {
+            'item': item,
+            'widget': widget,
+            'progress': progress,
+            'status': status_label,
+            'cancel_btn': cancel_btn,
+            'model': model_name,
+            'worker': None,
+            'finished': False
+        }
+        self.pulls.append(pull_info)
+        
+        cancel_btn.clicked.connect(lambda: self.cancel_pull(pull_info))
+        
+        self.start_next()
+        return True
+    
+    def start_next(self):
+        """Start the oldest queued pull if nothing is downloading"""
+        if self.active:
+            return
+        
+        for pull_info in self.pulls:
+            if not pull_info['finished'] and pull_info['worker'] is None:
+                worker = ModelPullWorker(self.client, pull_info['model'])
+                worker.progress.connect(lambda info, p=pull_info: self.update_progress(p, info))
+                worker.finished.connect(lambda success, message, p=pull_info: self.on_pull_finished(p, success, message))
+                pull_info['worker'] = worker
+                pull_info['status'].setText("Starting download...")
+                self.active = pull_info
+                worker.start()
+                return
+    
+    def update_progress(self, pull_info, info):
+        """Update pull progress"""
+        total = info['total']
+        completed = info['completed']
+        
+        if total > 0:
+            percent = int((completed / total) * 100)
+            pull_info['progress'].setValue(percent)
+            
+            # Format sizes
+            completed_mb = completed / (1024 * 1024)
+            total_mb = total / (1024 * 1024)
+            rate_mb = info['rate'] / (1024 * 1024)
+            status = f"{info['status']}... {completed_mb:.1f} MB / {total_mb:.1f} MB ({percent}%) at {rate_mb:.1f} MB/s"
+            if info['layers'] > 1:
+                status += f" - layer {info['layer']}/{info['layers']}: {info['layer_percent']}%"
+            pull_info['status'].setText(status)
+        else:
+            pull_info['status'].setText(f"{info['status']}...")
+    
+    def on_pull_finished(self, pull_info, success, message):
+        """Update pull state and move on to the next one in the queue"""
+        pull_info['finished'] = True
+        pull_info['cancel_btn'].setEnabled(False)
+        
+        if success:
+            pull_info['progress'].setValue(100)
+            pull_info['status'].setText("✅ Completed")
+            pull_info['status'].setStyleSheet("color: green; font-weight: bold;")
+            self.model_pulled.emit(pull_info['model'])
+        elif pull_info['worker'] and pull_info['worker'].cancelled:
+            pull_info['status'].setText("❌ Cancelled")
+            pull_info['status'].setStyleSheet("color: red;")
+            self.pull_failed.emit(pull_info['model'], "Download cancelled")
+        else:
+            pull_info['status'].setText(f"⚠️ Failed - {message}")
+            pull_info['status'].setStyleSheet("color: orange;")
+            self.pull_failed.emit(pull_info['model'], message)
+        
+        if self.active is pull_info:
+            self.active = None
+        self.start_next()
+    
+    def cancel_pull(self, pull_info):
+        """Cancel a running or queued pull"""
+        if pull_info['finished']:
+            return
+        
+        if pull_info['worker']:
+            pull_info['worker'].cancel()
+        else:
+            # Never started, just take it out of the queue
+            pull_info['finished'] = True
+            pull_info['cancel_btn'].setEnabled(False)
+            pull_info['status'].setText("❌ Cancelled")
+            pull_info['status'].setStyleSheet("color: red;")
+            self.pull_failed.emit(pull_info['model'], "Download cancelled")
+    
+    def cancel_all(self):
+        """Cancel every pull, e.g. when the browser closes"""
+        for pull_info in self.pulls:
+            self.cancel_pull(pull_info)
+    
+    def clear_finished(self):
+        """Remove finished pulls from the list"""
+        for pull_info in self.pulls[:]:
+            if pull_info['finished']:
+                row = self.pulls_list.row(pull_info['item'])
+                self.pulls_list.takeItem(row)
+                self.pulls.remove(pull_info)
+
+
 class OllamaInstaller(QThread):
     """Worker thread to install Ollama"""
     progress = pyqtSignal(str)
     finished = pyqtSignal(bool, str)
     
-    def __init__(self):
-        super().__init__()
-        self.system = platform.system()
+    def __init__(self):
+        super().__init__()
+        self.system = platform.system()
+    
+    def run(self):
+        try:
+            self.progress.emit("Detecting your operating system...")
+            
+            if self.system == "Windows":
+                self.install_windows()
+            elif self.system == "Darwin":  # macOS
+                self.install_macos()
+            elif self.system == "Linux":
+                self.install_linux()
+            else:
+                self.finished.emit(False, f"Unsupported OS: {self.system}")
+        except Exception as e:
+            self.finished.emit(False, f"Installation failed: {str(e)}")
+    
+    def install_windows(self):
+        self.progress.emit("Downloading Ollama for Windows...")
+        
+        url = "https://ollama.com/download/OllamaSetup.exe"
+        installer_path = os.path.join(os.environ.get("TEMP", "."), "OllamaSetup.exe")
+        
+        response = requests.get(url, stream=True)
+        total_size = int(response.headers.get('content-length', 0))
+        
+        with open(installer_path, 'wb') as f:
+            downloaded = 0
+            for chunk in response.iter_content(chunk_size=8192):
+                if chunk:
+                    f.write(chunk)
+                    downloaded += len(chunk)
+                    if total_size > 0:
+                        percent = int((downloaded / total_size) * 100)
+                        self.progress.emit(f"Downloading... {percent}%")
+        
+        self.progress.emit("Running installer...")
+        subprocess.run([installer_path, "/S"], check=True)
+        
+        self.progress.emit("Installation complete! Starting Ollama...")
+        subprocess.Popen(["ollama", "serve"], 
+                        creationflags=subprocess.CREATE_NO_WINDOW if self.system == "Windows" else 0)
+        
+        self.finished.emit(True, "Ollama installed successfully!")
+    
+    def install_macos(self):
+        self.progress.emit("Downloading Ollama for macOS...")
+        
+        url = "https://ollama.com/download/Ollama-darwin.zip"
+        installer_path = "/tmp/Ollama.zip"
+        
+        response = requests.get(url, stream=True)
+        with open(installer_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=8192):
+                if chunk:
+                    f.write(chunk)
+        
+        self.progress.emit("Installing...")
+        subprocess.run(["unzip", "-o", installer_path, "-d", "/Applications/"], check=True)
+        
+        self.progress.emit("Starting Ollama...")
+        subprocess.Popen(["/Applications/Ollama.app/Contents/MacOS/ollama", "serve"])
+        
+        self.finished.emit(True, "Ollama installed successfully!")
+    
+    def install_linux(self):
+        self.progress.emit("Installing Ollama for Linux...")
+        
+        install_script = subprocess.check_output(
+            ["curl", "-fsSL", "https://ollama.com/install.sh"]
+        )
+        
+        subprocess.run(["sh", "-c", install_script.decode()], check=True)
+        
+        self.progress.emit("Starting Ollama...")
+        subprocess.Popen(["ollama", "serve"])
+        
+        self.finished.emit(True, "Ollama installed successfully!")
+
+
+class RequestCancelled(Exception):
+    """Raised by OllamaClient.request when its RequestHandle was cancelled"""
+
+
+class RequestHandle:
+    """Lets another thread abort an OllamaClient request at any point.
+    
+    The client checks it before every attempt and while backing off, and the
+    connection pool lends it the connection the request goes out on, so
+    cancel() can shut that socket down even while the server is still
+    evaluating the prompt. Ollama stops generating when the connection drops.
+    """
+    # The handle of the request running on the current thread, for TrackedPool
+    current = threading.local()
+    
+    def __init__(self):
+        self.is_cancelled = False
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        self.connection = None
+    
+    def attach(self, connection):
+        with self.lock:
+            self.connection = connection
+            connection.request_handle = self
+    
+    def detach(self, connection):
+        with self.lock:
+            if self.connection is connection:
+                self.connection = None
+            connection.request_handle = None
+    
+    def cancel(self):
+        self.is_cancelled = True
+        self.wakeup.set()
+        # Under the lock, so the connection can't go back to the pool and on to another request meanwhile
+        with self.lock:
+            sock = getattr(self.connection, "sock", None)
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+class TrackedPool:
+    """urllib3 pool mixin that lends each connection to the RequestHandle of the thread taking it"""
+    
+    def _get_conn(self, timeout=None):
+        connection = super()._get_conn(timeout)
+        handle = getattr(RequestHandle.current, "handle", None)
+        if handle is not None:
+            handle.attach(connection)
+        return connection
+    
+    def _put_conn(self, conn):
+        handle = getattr(conn, "request_handle", None)
+        if handle is not None:
+            handle.detach(conn)
+        super()._put_conn(conn)
+
+
+class TrackedHTTPConnectionPool(TrackedPool, urllib3.HTTPConnectionPool):
+    pass
+
+
+class TrackedHTTPSConnectionPool(TrackedPool, urllib3.HTTPSConnectionPool):
+    pass
+
+
+class OllamaAdapter(requests.adapters.HTTPAdapter):
+    """HTTPAdapter whose pools hand their connections to RequestHandles"""
+    
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TrackedHTTPConnectionPool,
+            "https": TrackedHTTPSConnectionPool,
+        }
+
+
+class OllamaClient:
+    """Shared HTTP client for all traffic to the Ollama server.
+    
+    Requests go through one keep-alive session with a connection pool, so they
+    don't pay for a new TCP connection each time. The server address comes from
+    the constructor, the OLLAMA_HOST environment variable, or the local default.
+    Connection failures and "server busy" responses are retried with
+    exponential backoff; read timeouts are not, since that would start the
+    generation over. A RequestHandle passed as `handle` can abort a request
+    from another thread, retries and backoff included.
+    """
+    default_base_url = "http://localhost:11434"
+    # (connect, read) timeouts in seconds per endpoint
+    timeouts = {
+        "/api/tags": (2, 5),
+        "/api/ps": (2, 5),
+        "/api/show": (2, 10),
+        "/api/chat": (5, 120),
+        "/api/generate": (5, 120),
+        "/api/embed": (5, 60),
+        "/api/pull": (5, 300),
+    }
+    default_timeout = (5, 30)
+    retry_statuses = (429, 502, 503, 504)
+    
+    def __init__(self, base_url=None, pool_size=8, retries=2, backoff=0.5):
+        self.base_url = self.normalize_url(base_url or os.environ.get("OLLAMA_HOST") or self.default_base_url)
+        self.retries = retries
+        self.backoff = backoff
+        
+        self.session = requests.Session()
+        adapter = OllamaAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+    
+    def normalize_url(self, url):
+        """Accept OLLAMA_HOST style values like "host", "host:port" or a full URL"""
+        url = url.strip().rstrip("/")
+        if "://" not in url:
+            url = "http://" + url
+            if url.count(":") < 2:
+                url += ":11434"
+        return url
+    
+    def is_local(self):
+        """Whether the server runs on this machine (and can be started by us)"""
+        host = requests.utils.urlparse(self.base_url).hostname
+        return host in ("localhost", "127.0.0.1", "::1", "0.0.0.0")
+    
+    def timeout_for(self, path):
+        return self.timeouts.get(path, self.default_timeout)
+    
+    def request(self, method, path, retries=None, timeout=None, handle=None, **kwargs):
+        """Send a request to the Ollama server, retrying with backoff when it is unreachable or busy"""
+        retries = self.retries if retries is None else retries
+        timeout = timeout or self.timeout_for(path)
+        url = self.base_url + path
+        
+        for attempt in range(retries + 1):
+            if handle is not None and handle.is_cancelled:
+                raise RequestCancelled()
+            RequestHandle.current.handle = handle
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except requests.exceptions.RequestException as e:
+                # A cancelled request fails with whatever error the closed socket gives
+                if handle is not None and handle.is_cancelled:
+                    raise RequestCancelled() from e
+                if attempt == retries or not isinstance(e, requests.exceptions.ConnectionError):
+                    raise
+            else:
+                if response.status_code not in self.retry_statuses or attempt == retries:
+                    return response
+                response.close()
+            finally:
+                RequestHandle.current.handle = None
+            
+            delay = self.backoff * (2 ** attempt)
+            if handle is None:
+                time.sleep(delay)
+            elif handle.wakeup.wait(delay):
+                raise RequestCancelled()
+    
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+    
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+
+class ModelPullWorker(QThread):
+    """Worker thread that pulls a model through the streaming /api/pull endpoint"""
+    progress = pyqtSignal(dict)
+    finished = pyqtSignal(bool, str)
+    
+    # Minimum seconds between progress updates
+    progress_interval = 0.25
+    
+    def __init__(self, client, model_name):
+        super().__init__()
+        self.client = client
+        self.model_name = model_name
+        self.cancelled = False
+        self.response = None
+    
+    def cancel(self):
+        """Stop the pull; closing the stream makes Ollama abort the download"""
+        self.cancelled = True
+        if self.response is not None:
+            try:
+                self.response.close()
+            except Exception:
+                pass
+    
+    def run(self):
+        try:
+            self.response = self.client.post(
+                "/api/pull",
+                json={"model": self.model_name, "stream": True},
+                stream=True
+            )
+            if self.cancelled:
+                self.response.close()
+                self.finished.emit(False, "Cancelled")
+                return
+            
+            if self.response.status_code != 200:
+                error_detail = self.response.text
+                try:
+                    error_detail = self.response.json().get("error", error_detail)
+                except:
+                    pass
+                self.finished.emit(False, f"Ollama Error ({self.response.status_code}): {error_detail}")
+                return
+            
+            self.read_progress(self.response)
+        except Exception as e:
+            if self.cancelled:
+                self.finished.emit(False, "Cancelled")
+            else:
+                self.finished.emit(False, str(e))
+        finally:
+            if self.response is not None:
+                self.response.close()
+    
+    def read_progress(self, response):
+        """Follow the NDJSON status stream and emit byte-level progress"""
+        layers = {}  # digest -> [completed, total], in download order
+        last_emit = 0.0
+        rate_time = time.monotonic()
+        rate_bytes = 0
+        rate = 0.0
+        
+        for line in response.iter_lines():
+            if self.cancelled:
+                self.finished.emit(False, "Cancelled")
+                return
+            if not line:
+                continue
+            
+            data = json.loads(line)
+            if data.get("error"):
+                self.finished.emit(False, data["error"])
+                return
+            
+            status = data.get("status", "")
+            if status == "success":
+                self.finished.emit(True, "")
+                return
+            
+            digest = data.get("digest")
+            if digest and data.get("total"):
+                layers[digest] = [data.get("completed", 0), data["total"]]
+            
+            completed = sum(layer[0] for layer in layers.values())
+            total = sum(layer[1] for layer in layers.values())
+            
+            now = time.monotonic()
+            if now - last_emit < self.progress_interval:
+                continue
+            
+            # Transfer rate over the last second or so, smoothed a little
+            if now - rate_time >= 1.0:
+                current = (completed - rate_bytes) / (now - rate_time)
+                rate = current if rate == 0 else 0.7 * rate + 0.3 * current
+                rate_time = now
+                rate_bytes = completed
+            
+            layer_index = list(layers).index(digest) + 1 if digest in layers else len(layers)
+            layer_completed, layer_total = layers.get(digest, [0, 0])
+            self.progress.emit({
+                'status': status or "Downloading",
+                'completed': completed,
+                'total': total,
+                'rate': rate,
+                'layer': layer_index,
+                'layers': len(layers),
+                'layer_percent': int(layer_completed * 100 / layer_total) if layer_total else 0
+            })
+            last_emit = now
+        
+        if self.cancelled:
+            self.finished.emit(False, "Cancelled")
+        else:
+            self.finished.emit(False, "Connection closed before the download finished")
+
+
+class ScreenshotPipeline:
+    """Turns the visible page into a compact image payload for vision models.
+    
+    Only the grab has to happen on the GUI thread. Scaling and encoding work on
+    a QImage and run on the thread pool. Frames are scaled down to roughly the
+    model's native input size, since the model would resize them anyway, and
+    encoded as JPEG (or WebP) rather than PNG.
+    """
+    default_max_side = 1120
+    min_side = 336
+    
+    def __init__(self, image_format="JPEG", quality=80, max_side=None):
+        image_format = image_format.upper()
+        if image_format.encode() not in [bytes(f).upper() for f in QImageWriter.supportedImageFormats()]:
+            image_format = "JPEG"
+        self.image_format = image_format
+        self.quality = quality
+        self.max_side = max_side or self.default_max_side
+    
+    def target_side(self, details):
+        """Longest side to send to a model, based on its vision encoder's input size"""
+        if details:
+            for key, value in details.get("model_info", {}).items():
+                if key.endswith("vision.image_size") and value:
+                    # Tiling encoders (llava-next, mllama) take up to 2x2 tiles
+                    return max(self.min_side, min(self.max_side, int(value) * 2))
+        return self.max_side
+    
+    def grab(self, browser):
+        """Capture the visible part of a web view (GUI thread only)"""
+        return browser.grab().toImage()
+    
+    def encode(self, image, max_side):
+        """Scale and encode a QImage, returning base64 text (safe to call from any thread)"""
+        if max(image.width(), image.height()) > max_side:
+            image = image.scaled(
+                max_side, max_side,
+                Qt.AspectRatioMode.KeepAspectRatio,
+                Qt.TransformationMode.SmoothTransformation
+            )
+        # JPEG has no alpha channel
+        image = image.convertToFormat(QImage.Format.Format_RGB888)
+        
+        data = QByteArray()
+        buffer = QBuffer(data)
+        buffer.open(QBuffer.OpenModeFlag.WriteOnly)
+        image.save(buffer, self.image_format, self.quality)
+        buffer.close()
+        
+        # Base64 straight from the QByteArray, without a round trip through Python bytes
+        return data.toBase64().data().decode("ascii")
+    
+    def perceptual_hash(self, image):
+        """64-bit difference hash: near-identical frames give near-identical hashes"""
+        small = image.scaled(
+            9, 8,
+            Qt.AspectRatioMode.IgnoreAspectRatio,
+            Qt.TransformationMode.SmoothTransformation
+        ).convertToFormat(QImage.Format.Format_Grayscale8)
+        
+        value = 0
+        for y in range(8):
+            for x in range(8):
+                left = small.pixelColor(x, y).value()
+                right = small.pixelColor(x + 1, y).value()
+                value = (value << 1) | (left > right)
+        return value
+    
+    def hash_distance(self, a, b):
+        """Number of differing bits between two perceptual hashes"""
+        return bin(a ^ b).count("1")
+
+
+class PageTileCapture(QObject):
+    """Captures a whole page as viewport-sized tiles by scrolling through it.
+    
+    Tiles that look the same as one already captured (sticky overlays, empty
+    space at the bottom) are skipped by perceptual hash. A page taller than
+    max_tiles viewports is sampled instead: the tiles are spread evenly from
+    top to bottom and `sampled` is set, so callers can say parts were left
+    out. The original scroll
+    position is restored afterwards. `is_valid` is asked before every step;
+    once it returns False (the tab was closed or left) the capture fails
+    without touching the web view again.
+    """
+    finished = pyqtSignal(list)
+    failed = pyqtSignal(str)
+    
+    # Time for the page to repaint after scrolling
+    settle_ms = 300
+    max_tiles = 8
+    # Hashes this many bits apart or less count as the same frame
+    duplicate_distance = 4
+    
+    metrics_js = """JSON.stringify({
+        x: window.scrollX,
+        y: window.scrollY,
+        view: window.innerHeight,
+        height: Math.max(document.documentElement.scrollHeight, document.body ? document.body.scrollHeight : 0)
+    })"""
+    
+    def __init__(self, browser, pipeline, is_valid=None, parent=None):
+        super().__init__(parent)
+        self.browser = browser
+        self.pipeline = pipeline
+        self.is_valid = is_valid or (lambda: True)
+        self.tiles = []
+        self.hashes = []
+        self.positions = []
+        self.skipped = 0
+        self.sampled = False
+        self.origin = (0, 0)
+    
+    def start(self):
+        self.browser.page().runJavaScript(self.metrics_js, self.on_metrics)
+    
+    def check_valid(self):
+        if self.is_valid():
+            return True
+        self.failed.emit("The tab was closed or switched while it was being captured")
+        return False
+    
+    def on_metrics(self, result):
+        if not self.check_valid():
+            return
+        try:
+            metrics = json.loads(result)
+            view = max(int(metrics["view"]), 1)
+            height = int(metrics["height"])
+            self.origin = (int(metrics["x"]), int(metrics["y"]))
+        except (TypeError, ValueError, KeyError):
+            self.failed.emit("Could not measure the page")
+            return
+        
+        last = max(height - view, 0)
+        self.positions = list(range(0, last, view)) + [last]
+        if len(self.positions) > self.max_tiles:
+            self.sampled = True
+            self.positions = [round(i * last / (self.max_tiles - 1)) for i in range(self.max_tiles)]
+        self.next_tile()
+    
+    def next_tile(self):
+        if not self.check_valid():
+            return
+        if not self.positions:
+            x, y = self.origin
+            self.browser.page().runJavaScript(f"window.scrollTo({x}, {y})")
+            self.finished.emit(self.tiles)
+            return
+        
+        y = self.positions.pop(0)
+        self.browser.page().runJavaScript(f"window.scrollTo(0, {y})")
+        QTimer.singleShot(self.settle_ms, self.capture_tile)
+    
+    def capture_tile(self):
+        if not self.check_valid():
+            return
+        image = self.pipeline.grab(self.browser)
+        image_hash = self.pipeline.perceptual_hash(image)
+        
+        if any(self.pipeline.hash_distance(image_hash, seen) <= self.duplicate_distance for seen in self.hashes):
+            self.skipped += 1
+        else:
+            self.hashes.append(image_hash)
+            self.tiles.append(image)
+        
+        self.next_tile()
+
+
+class PageExtractor:
+    """Pulls the main content out of a page instead of its raw text.
+    
+    The script runs inside the page and, much like Firefox's Reader View, picks
+    the element holding most of the paragraph text while skipping navigation,
+    cookie banners, sidebars and footers. It returns headings, content blocks,
+    tables and links as JSON; `format` then packs the most relevant parts into
+    a character budget.
+    """
+    script = r"""(function() {
+        var NOISE = /(^|[-_ ])(nav|navbar|menu|footer|sidebar|cookie|consent|gdpr|banner|popup|modal|newsletter|subscribe|share|social|comments?|related|promo|advert|ads?)([-_ ]|$)/i;
+        var BLOCKS = "h1, h2, h3, h4, p, li, pre, blockquote, dt, dd, table";
+        function clean(s) { return (s || "").replace(/\s+/g, " ").trim(); }
+        function noisy(el) {
+            for (var n = el; n && n !== document.body; n = n.parentElement) {
+                if (/^(NAV|FOOTER|ASIDE|FORM|SCRIPT|STYLE|NOSCRIPT)$/.test(n.tagName)) return true;
+                if (/navigation|banner|contentinfo|complementary|dialog|alertdialog/.test(n.getAttribute("role") || "")) return true;
+                var cls = typeof n.className == "string" ? n.className : "";
+                if (NOISE.test((n.id || "") + " " + cls)) return true;
+            }
+            return false;
+        }
+        function linkDensity(el) {
+            var total = clean(el.textContent).length || 1, links = 0;
+            el.querySelectorAll("a").forEach(function(a) { links += clean(a.textContent).length; });
+            return links / total;
+        }
+        
+        // Prefer explicit markup, otherwise score containers by the paragraphs inside them
+        var root = document.querySelector("article, main, [role=main]");
+        if (!root || clean(root.textContent).length < 200) {
+            var scores = new Map();
+            document.querySelectorAll("p, pre, td, li").forEach(function(p) {
+                var text = clean(p.textContent);
+                if (text.length < 25 || noisy(p)) return;
+                var score = 1 + text.split(",").length + Math.min(text.length / 100, 3);
+                var parent = p.parentElement, grand = parent && parent.parentElement;
+                if (parent) scores.set(parent, (scores.get(parent) || 0) + score);
+                if (grand) scores.set(grand, (scores.get(grand) || 0) + score / 2);
+            });
+            var best = null, bestScore = 0;
+            scores.forEach(function(score, el) {
+                score *= 1 - linkDensity(el);
+                if (score > bestScore) { best = el; bestScore = score; }
+            });
+            root = best || document.body;
+            // Siblings often hold the rest of the article
+            if (best && best.parentElement && best !== document.body) root = best.parentElement;
+        }
+        
+        var blocks = [], tables = [], size = 0;
+        root.querySelectorAll(BLOCKS).forEach(function(el) {
+            if (size > 200000 || noisy(el)) return;
+            var outer = el.parentElement && el.parentElement.closest(BLOCKS);
+            if (outer && root.contains(outer)) return;
+            if (el.tagName == "TABLE") {
+                var rows = [];
+                el.querySelectorAll("tr").forEach(function(tr) {
+                    if (rows.length >= 30) return;
+                    var cells = [];
+                    tr.querySelectorAll("th, td").forEach(function(c) { if (cells.length < 10) cells.push(clean(c.textContent).slice(0, 80)); });
+                    if (cells.join("").length) rows.push(cells);
+                });
+                if (rows.length) { tables.push({caption: clean(el.caption && el.caption.textContent), rows: rows, index: blocks.length}); }
+                return;
+            }
+            var text = clean(el.innerText || el.textContent);
+            if (!text) return;
+            var heading = /^H\d$/.test(el.tagName);
+            if (!heading && text.length < 3) return;
+            var score = heading ? 5 : (1 - linkDensity(el)) * (Math.min(text.length, 1000) / 100 + text.split(",").length);
+            blocks.push({tag: el.tagName.toLowerCase(), text: text.slice(0, 4000), score: score});
+            size += text.length;
+        });
+        
+        var headings = [];
+        document.querySelectorAll("h1, h2, h3").forEach(function(h) {
+            var text = clean(h.textContent);
+            if (text && headings.length < 40 && !noisy(h)) headings.push({level: +h.tagName[1], text: text.slice(0, 150)});
+        });
+        
+        var links = [], seen = {};
+        root.querySelectorAll("a[href]").forEach(function(a) {
+            var text = clean(a.textContent);
+            if (links.length >= 30 || text.length < 4 || seen[a.href] || !/^https?:/.test(a.href) || noisy(a)) return;
+            seen[a.href] = true;
+            links.push({text: text.slice(0, 100), href: a.href});
+        });
+        
+        var description = document.querySelector("meta[name=description]");
+        return JSON.stringify({
+            description: description ? clean(description.content) : "",
+            headings: headings,
+            blocks: blocks,
+            tables: tables,
+            links: links
+        });
+    })()"""
+    
+    # Prompts for Analyze Page; part of the cache key, so editing them invalidates old answers
+    prompt = ("I'm currently viewing this webpage:\n\nURL: {url}\nTitle: {title}\n\nPage content:\n{content}\n\n"
+              "Please analyze this page and tell me what it's about, including key information and main topics.")
+    long_prompt = ("I'm currently viewing this webpage:\n\nURL: {url}\nTitle: {title}\n\n"
+                   "The page is long, so it was read in parts. Summaries of the parts, in page order:\n\n{content}\n\n"
+                   "Please analyze this page and tell me what it's about, including key information and main topics.")
+    
+    # Below this much main text the page is probably an app shell, use the plain text instead
+    min_text = 200
+    # Parts of the budget that the outline, tables and links may use at most
+    outline_share = 0.1
+    table_share = 0.2
+    link_share = 0.1
+    
+    def parse(self, result):
+        """Decode the script's result, or return None if it found nothing useful"""
+        try:
+            data = json.loads(result)
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(data, dict) or sum(len(block["text"]) for block in data.get("blocks", [])) < self.min_text:
+            return None
+        return data
+    
+    def full_text(self, data):
+        """All extracted content blocks as plain text, in page order"""
+        return "\n\n".join(self.format_block(block) for block in data["blocks"])
+    
+    def format_block(self, block):
+        if block["tag"][0] == "h" and block["tag"][1:].isdigit():
+            return "#" * int(block["tag"][1:]) + " " + block["text"]
+        if block["tag"] == "li":
+            return "- " + block["text"]
+        return block["text"]
+    
+    def format_table(self, table):
+        lines = [table["caption"]] if table.get("caption") else []
+        lines += [" | ".join(row) for row in table["rows"]]
+        return "\n".join(lines)
+    
+    def fit(self, parts, budget):
+        """Take parts in order until the budget is used up"""
+        taken = []
+        for part in parts:
+            if len(part) + 1 > budget:
+                break
+            taken.append(part)
+            budget -= len(part) + 1
+        return taken
+    
+    def format(self, data, max_chars):
+        """Pack the extracted data into at most max_chars of prompt text"""
+        sections = []
+        
+        outline = self.fit(
+            ["  " * (h["level"] - 1) + h["text"] for h in data.get("headings", [])],
+            int(max_chars * self.outline_share)
+        )
+        tables = self.fit(
+            [self.format_table(table) for table in data.get("tables", [])],
+            int(max_chars * self.table_share)
+        )
+        links = self.fit(
+            [f"- {link['text']}: {link['href']}" for link in data.get("links", [])],
+            int(max_chars * self.link_share)
+        )
+        
+        # Main text gets whatever the other sections left over
+        budget = max_chars - len(data.get("description", "")) - sum(len(part) + 1 for part in outline + tables + links) - 100
+        blocks = data["blocks"]
+        if sum(len(self.format_block(block)) + 2 for block in blocks) > budget:
+            # Keep the highest-scoring blocks, shown in page order
+            chosen = set()
+            for index in sorted(range(len(blocks)), key=lambda i: -blocks[i]["score"]):
+                length = len(self.format_block(blocks[index])) + 2
+                if length <= budget:
+                    chosen.add(index)
+                    budget -= length
+            blocks = [block for index, block in enumerate(blocks) if index in chosen]
+        
+        if data.get("description"):
+            sections.append(f"Summary: {data['description']}")
+        if outline:
+            sections.append("Outline:\n" + "\n".join(outline))
+        sections.append("Main content:\n" + "\n\n".join(self.format_block(block) for block in blocks))
+        if tables:
+            sections.append("Tables:\n" + "\n\n".join(tables))
+        if links:
+            sections.append("Links:\n" + "\n".join(links))
+        return "\n\n".join(sections)
+    
+    def chunks(self, text, max_chars):
+        """Split text into pieces of at most max_chars, breaking between paragraphs where possible"""
+        pieces = []
+        current = ""
+        for paragraph in text.split("\n\n"):
+            while len(paragraph) > max_chars:
+                # A single huge paragraph is cut at the last space that fits
+                cut = paragraph.rfind(" ", 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                if current:
+                    pieces.append(current)
+                    current = ""
+                pieces.append(paragraph[:cut])
+                paragraph = paragraph[cut:].lstrip()
+            if current and len(current) + len(paragraph) + 2 > max_chars:
+                pieces.append(current)
+                current = ""
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+        if current.strip():
+            pieces.append(current)
+        return pieces
+    
+    def format_text(self, text, max_chars):
+        """Fallback for pages the script could not make sense of"""
+        if len(text) > max_chars:
+            text = text[:max_chars] + "\n\n...(content truncated for length)"
+        return text
+
+
+class ResultCache:
+    """Persistent store for finished AI answers, kept in an SQLite table.
+    
+    Entries are looked up by a hash of whatever identifies the request. Once the
+    stored answers grow past `max_bytes`, the least recently used ones are
+    evicted; with a `ttl` (seconds), older entries count as missing. Each call
+    opens its own connection, so the cache can be used from worker threads and
+    the file can be deleted along with the profile. With no path it stores nothing.
+    """
+    
+    def __init__(self, path, table, max_bytes=16 * 1024 * 1024, ttl=None):
+        self.path = path
+        self.table = table
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+    
+    @staticmethod
+    def make_key(*parts):
+        return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+    
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=5)
+        connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} "
+            "(key TEXT PRIMARY KEY, value TEXT, size INTEGER, created REAL, used REAL)"
+        )
+        return connection
+    
+    def get(self, key):
+        """Return the stored answer for key, or None"""
+        if not self.path:
+            return None
+        try:
+            with closing(self.connect()) as connection, connection:
+                row = connection.execute(
+                    f"SELECT value, created FROM {self.table} WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if self.ttl is not None and time.time() - row[1] > self.ttl:
+                    connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                    return None
+                connection.execute(f"UPDATE {self.table} SET used = ? WHERE key = ?", (time.time(), key))
+                return row[0]
+        except sqlite3.Error as e:
+            print(f"Warning: result cache unavailable: {e}")
+            return None
+    
+    def put(self, key, value):
+        if not self.path:
+            return
+        try:
+            with closing(self.connect()) as connection, connection:
+                now = time.time()
+                connection.execute(
+                    f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?, ?)",
+                    (key, value, len(value.encode("utf-8")), now, now)
+                )
+                self.evict(connection)
+        except sqlite3.Error as e:
+            print(f"Warning: result cache unavailable: {e}")
+    
+    def evict(self, connection):
+        """Drop expired entries, then the least recently used ones over the size limit"""
+        if self.ttl is not None:
+            connection.execute(f"DELETE FROM {self.table} WHERE created < ?", (time.time() - self.ttl,))
+        
+        total = 0
+        stale = []
+        for key, size in connection.execute(f"SELECT key, size FROM {self.table} ORDER BY used DESC"):
+            total += size
+            if total > self.max_bytes:
+                stale.append((key,))
+        connection.executemany(f"DELETE FROM {self.table} WHERE key = ?", stale)
+
+
+class ConversationStore:
+    """Chat conversations saved in SQLite, one row per message.
+    
+    Page dumps and screenshots go into a blob table keyed by their SHA-256,
+    so content that is sent again is only stored once. Messages
+    are read a page at a time, newest first, so opening a long conversation
+    only loads what is shown. Like ResultCache, every call opens its own
+    connection, and with no path nothing is stored.
+    """
+    def __init__(self, path):
+        self.path = path
+    
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=5)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS conversations "
+            "(id INTEGER PRIMARY KEY, title TEXT, created REAL, updated REAL)"
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY, conversation INTEGER, role TEXT, "
+            "content TEXT, blob TEXT, kind TEXT, stub TEXT, image TEXT, created REAL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS messages_conversation ON messages (conversation, id)")
+        connection.execute("CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, data BLOB, size INTEGER)")
+        return connection
+    
+    def put_blob(self, connection, data):
+        key = hashlib.sha256(data).hexdigest()
+        connection.execute("INSERT OR IGNORE INTO blobs VALUES (?, ?, ?)", (key, data, len(data)))
+        return key
+    
+    def create(self):
+        """Start a new conversation and return its id, or None without storage"""
+        if not self.path:
+            return None
+        try:
+            with closing(self.connect()) as connection, connection:
+                now = time.time()
+                return connection.execute(
+                    "INSERT INTO conversations (title, created, updated) VALUES ('', ?, ?)", (now, now)
+                ).lastrowid
+        except sqlite3.Error as e:
+            print(f"Warning: conversation store unavailable: {e}")
+            return None
+    
+    def append(self, conversation, message, image_base64=None):
+        """Save a history message (and the screenshot sent with it), returning the row id"""
+        if not self.path or conversation is None:
+            return None
+        content = message["content"]
+        kind = message.get("kind")
+        try:
+            with closing(self.connect()) as connection, connection:
+                blob = None
+                # Plain messages stay inline, since the transcript shows them in full
+                if kind:
+                    blob = self.put_blob(connection, content.encode("utf-8"))
+                    content = None
+                image = self.put_blob(connection, base64.b64decode(image_base64)) if image_base64 else None
+                now = time.time()
+                row = connection.execute(
+                    "INSERT INTO messages (conversation, role, content, blob, kind, stub, image, created) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (conversation, message["role"], content, blob, kind, message.get("stub"), image, now)
+                ).lastrowid
+                connection.execute("UPDATE conversations SET updated = ? WHERE id = ?", (now, conversation))
+                if message["role"] == "user":
+                    title = " ".join((message.get("stub") if kind else message["content"]).split())[:80]
+                    connection.execute(
+                        "UPDATE conversations SET title = ? WHERE id = ? AND title = ''", (title, conversation)
+                    )
+                return row
+        except sqlite3.Error as e:
+            print(f"Warning: conversation store unavailable: {e}")
+            return None
+    
+    def messages(self, conversation, before=None, limit=50, full=False):
+        """Up to `limit` messages older than row `before`, oldest first.
+        
+        Each is a history dict plus its row "id". Blob content is only read
+        with full=True; otherwise blob messages carry their stub as content,
+        which is all the chat transcript shows of them.
+        """
+        if not self.path or conversation is None:
+            return []
+        if full:
+            query = ("SELECT m.id, m.role, COALESCE(m.content, CAST(b.data AS TEXT)), m.kind, m.stub FROM messages m "
+                     "LEFT JOIN blobs b ON b.hash = m.blob WHERE m.conversation = ? AND m.id < ? "
+                     "ORDER BY m.id DESC LIMIT ?")
+        else:
+            query = ("SELECT id, role, COALESCE(content, stub, ''), kind, stub FROM messages "
+                     "WHERE conversation = ? AND id < ? ORDER BY id DESC LIMIT ?")
+        try:
+            with closing(self.connect()) as connection:
+                rows = connection.execute(query, (conversation, before or sys.maxsize, limit)).fetchall()
+        except sqlite3.Error as e:
+            print(f"Warning: conversation store unavailable: {e}")
+            return []
+        
+        messages = []
+        for row, role, content, kind, stub in reversed(rows):
+            message = {"id": row, "role": role, "content": content or ""}
+            if kind:
+                message["kind"] = kind
+                message["stub"] = stub
+            messages.append(message)
+        return messages
+    
+    def latest(self):
+        """Id of the most recently used conversation, or None"""
+        conversations = self.conversations(limit=1)
+        return conversations[0]["id"] if conversations else None
+    
+    def conversations(self, limit=20):
+        """Recent conversations as dicts with id, title, updated and the message count"""
+        if not self.path:
+            return []
+        try:
+            with closing(self.connect()) as connection:
+                rows = connection.execute(
+                    "SELECT c.id, c.title, c.updated, "
+                    "(SELECT COUNT(*) FROM messages m WHERE m.conversation = c.id) "
+                    "FROM conversations c WHERE EXISTS (SELECT 1 FROM messages m WHERE m.conversation = c.id) "
+                    "ORDER BY c.updated DESC LIMIT ?", (limit,)
+                ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Warning: conversation store unavailable: {e}")
+            return []
+        return [
+            {"id": row, "title": title, "updated": updated, "count": count}
+            for row, title, updated, count in rows
+        ]
+
+
+class EmbeddingStore:
+    """Embedding vectors in a memory-mapped float32 file, chunk text in SQLite.
+    
+    Row i of vectors.f32 belongs to the chunk stored with row id i, so the only
+    per-chunk state kept in memory is a few NumPy arrays. Chunks are keyed by a
+    hash of their text and a known chunk is never embedded twice. Search is an
+    exact matrix-vector product until the store outgrows `approx_threshold`
+    rows; beyond that an inverted-file index of k-means clusters limits it to
+    the rows in the clusters closest to the query.
+    """
+    approx_threshold = 20000
+    # Clusters scanned per query once the approximate index is in use
+    probes = 12
+    # Rows the clusters are trained on
+    sample_size = 5000
+    
+    def __init__(self, directory, model):
+        self.directory = directory
+        self.model = model
+        self.db_path = os.path.join(directory, "chunks.sqlite")
+        self.vector_path = os.path.join(directory, "vectors.f32")
+        self.centroid_path = os.path.join(directory, "centroids.npy")
+        self.assign_path = os.path.join(directory, "assign.npy")
+        self.lock = threading.RLock()
+        self.building = False
+        self.dirty = []
+        self.open()
+    
+    def connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=5)
+        connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, title TEXT, hash TEXT, indexed REAL)"
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (row INTEGER PRIMARY KEY, url TEXT, hash TEXT, text TEXT)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS chunks_url ON chunks (url)")
+        connection.execute("CREATE INDEX IF NOT EXISTS chunks_hash ON chunks (hash)")
+        return connection
+    
+    def open(self):
+        """Load the row map and vectors, starting over if the embedding model changed"""
+        os.makedirs(self.directory, exist_ok=True)
+        with closing(self.connect()) as connection:
+            meta = dict(connection.execute("SELECT key, value FROM meta").fetchall())
+        
+        if meta.get("model", self.model) != self.model:
+            for path in (self.db_path, self.vector_path, self.centroid_path, self.assign_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            meta = {}
+        
+        self.dim = int(meta["dim"]) if "dim" in meta else None
+        self.vectors = None
+        self.count = 0
+        self.alive = np.zeros(0, dtype=bool)
+        self.assign = np.zeros(0, dtype=np.int32)
+        self.centroids = None
+        self.lists = None
+        self.built_count = 0
+        
+        if self.dim is None or not os.path.exists(self.vector_path):
+            self.dim = None
+            return
+        
+        capacity = os.path.getsize(self.vector_path) // (4 * self.dim)
+        self.vectors = np.memmap(self.vector_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        with closing(self.connect()) as connection:
+            rows = np.array([row for row, in connection.execute("SELECT row FROM chunks")], dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.alive[rows] = True
+        self.count = int(rows.max()) + 1 if len(rows) else 0
+        
+        if os.path.exists(self.centroid_path) and os.path.exists(self.assign_path):
+            centroids = np.load(self.centroid_path)
+            assign = np.load(self.assign_path)
+            if centroids.shape[1] == self.dim:
+                self.centroids = centroids
+                self.assign = np.full(capacity, -1, dtype=np.int32)
+                self.assign[:min(len(assign), capacity)] = assign[:capacity]
+                # Rows added after the index was saved still need a cluster
+                unassigned = np.flatnonzero(self.alive & (self.assign < 0))
+                if len(unassigned):
+                    self.assign[unassigned] = self.nearest_clusters(self.vectors[unassigned])
+                self.built_count = int(self.alive.sum())
+    
+    def ensure_capacity(self, needed):
+        """Grow the vector file (doubling) so it holds at least `needed` rows"""
+        capacity = len(self.alive)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 1024)
+        if self.vectors is not None:
+            self.vectors.flush()
+            self.vectors = None
+        with open(self.vector_path, "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self.vectors = np.memmap(self.vector_path, dtype=np.float32, mode="r+", shape=(new_capacity, self.dim))
+        self.alive = np.concatenate([self.alive, np.zeros(new_capacity - capacity, dtype=bool)])
+        self.assign = np.concatenate([self.assign, np.full(new_capacity - capacity, -1, dtype=np.int32)])
+    
+    def nearest_clusters(self, vectors):
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+    
+    def page_hash(self, url):
+        with closing(self.connect()) as connection:
+            row = connection.execute("SELECT hash FROM pages WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+    
+    def known_vectors(self, hashes):
+        """Copies of the stored vectors for chunk hashes already in the store"""
+        if self.vectors is None:
+            return {}
+        with closing(self.connect()) as connection:
+            placeholders = ",".join("?" * len(hashes))
+            rows = connection.execute(
+                f"SELECT hash, row FROM chunks WHERE hash IN ({placeholders})", hashes
+            ).fetchall()
+        with self.lock:
+            return {chunk_hash: np.array(self.vectors[row]) for chunk_hash, row in rows}
+    
+    def replace_page(self, url, title, page_hash, chunks, hashes, matrix):
+        """Swap a page's chunks for new ones; matrix holds one unit vector per chunk"""
+        with self.lock, closing(self.connect()) as connection, connection:
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+                connection.execute("INSERT OR REPLACE INTO meta VALUES ('dim', ?)", (str(self.dim),))
+                connection.execute("INSERT OR REPLACE INTO meta VALUES ('model', ?)", (self.model,))
+            if matrix.shape[1] != self.dim:
+                raise ValueError(f"Embedding size changed from {self.dim} to {matrix.shape[1]}")
+            
+            old_rows = [row for row, in connection.execute("SELECT row FROM chunks WHERE url = ?", (url,))]
+            connection.execute("DELETE FROM chunks WHERE url = ?", (url,))
+            self.alive[old_rows] = False
+            
+            # Reuse freed rows before growing the file
+            free = np.flatnonzero(~self.alive[:self.count])[:len(chunks)]
+            extra = len(chunks) - len(free)
+            rows = np.concatenate([free, np.arange(self.count, self.count + extra)]).astype(np.int64)
+            self.ensure_capacity(self.count + extra)
+            
+            self.vectors[rows] = matrix
+            self.vectors.flush()
+            self.alive[rows] = True
+            self.count += extra
+            if self.centroids is not None:
+                self.assign[rows] = self.nearest_clusters(matrix)
+            if self.building:
+                self.dirty.extend(rows.tolist())
+            self.lists = None
+            
+            connection.executemany(
+                "INSERT INTO chunks VALUES (?, ?, ?, ?)",
+                [(int(row), url, chunk_hash, chunk) for row, chunk_hash, chunk in zip(rows, hashes, chunks)]
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)", (url, title, page_hash, time.time())
+            )
+    
+    def remove_oldest_pages(self, keep):
+        """Forget the pages indexed longest ago beyond the newest `keep`"""
+        with self.lock, closing(self.connect()) as connection, connection:
+            stale = connection.execute(
+                "SELECT url FROM pages ORDER BY indexed DESC LIMIT -1 OFFSET ?", (keep,)
+            ).fetchall()
+            for url, in stale:
+                rows = [row for row, in connection.execute("SELECT row FROM chunks WHERE url = ?", (url,))]
+                self.alive[rows] = False
+            connection.executemany("DELETE FROM chunks WHERE url = ?", stale)
+            connection.executemany("DELETE FROM pages WHERE url = ?", stale)
+            if stale:
+                self.lists = None
+                # Clusters trained on far more rows than are left no longer fit; search
+                # exactly until needs_index() asks for new ones
+                if self.centroids is not None and int(self.alive.sum()) < self.built_count // 2:
+                    self.drop_index()
+    
+    def drop_index(self):
+        """Forget the approximate index, so searches are exact again"""
+        with self.lock:
+            self.centroids = None
+            self.lists = None
+            self.built_count = 0
+            for path in (self.centroid_path, self.assign_path):
+                if os.path.exists(path):
+                    os.remove(path)
+    
+    def needs_index(self):
+        """Whether the store has grown enough to (re)build the approximate index"""
+        alive = int(self.alive.sum())
+        return alive > self.approx_threshold and alive > 2 * self.built_count and not self.building
+    
+    def build_index(self, iterations=10):
+        """Train k-means clusters on a sample of the vectors and file every row under one"""
+        with self.lock:
+            if self.building:
+                return
+            self.building = True
+            self.dirty = []
+            rows = np.flatnonzero(self.alive[:self.count])
+            rng = np.random.default_rng(0)
+            sample = np.sort(rng.choice(rows, min(self.sample_size, len(rows)), replace=False))
+            data = np.array(self.vectors[sample])
+        
+        try:
+            clusters = max(int(math.sqrt(len(rows))), 1)
+            centroids = data[rng.choice(len(data), clusters, replace=False)]
+            for _ in range(iterations):
+                labels = np.argmax(data @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, data)
+                norms = np.linalg.norm(sums, axis=1, keepdims=True)
+                # Empty clusters keep their old centre
+                centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+            
+            # Assign in blocks to keep the temporary score matrix small. Each block
+            # is copied under the lock, since a write can remap or close the file
+            with self.lock:
+                assign = np.full(len(self.alive), -1, dtype=np.int32)
+            for start in range(0, len(rows), 8192):
+                block = rows[start:start + 8192]
+                with self.lock:
+                    if self.vectors is None:
+                        return
+                    vectors = np.array(self.vectors[block])
+                assign[block] = np.argmax(vectors @ centroids.T, axis=1)
+            
+            with self.lock:
+                if self.vectors is None:
+                    return
+                if len(assign) < len(self.alive):
+                    assign = np.concatenate([assign, np.full(len(self.alive) - len(assign), -1, dtype=np.int32)])
+                # Rows written while the clusters were being trained
+                changed = np.union1d(np.flatnonzero(self.alive & (assign < 0)), self.dirty).astype(np.int64)
+                if len(changed):
+                    assign[changed] = np.argmax(self.vectors[changed] @ centroids.T, axis=1)
+                self.centroids = centroids.astype(np.float32)
+                self.assign = assign
+                self.lists = None
+                self.built_count = int(self.alive.sum())
+                self.save_index()
+        finally:
+            self.building = False
+    
+    def close(self):
+        """Save the approximate index and let go of the vector file"""
+        self.save_index()
+        with self.lock:
+            if self.vectors is not None:
+                self.vectors.flush()
+            self.vectors = None
+            self.dim = None
+            self.count = 0
+            self.alive = np.zeros(0, dtype=bool)
+            self.centroids = None
+    
+    def save_index(self):
+        if self.centroids is not None:
+            with self.lock:
+                np.save(self.centroid_path, self.centroids)
+                np.save(self.assign_path, self.assign[:self.count])
+    
+    def search(self, query_vector, k):
+        """(row, score) pairs for the k rows closest to a unit query vector, best first"""
+        query = np.asarray(query_vector, dtype=np.float32)
+        with self.lock:
+            if self.count == 0:
+                return []
+            
+            if self.centroids is not None:
+                if self.lists is None:
+                    # Rows grouped by cluster: order[offsets[c]:offsets[c + 1]] is cluster c
+                    rows = np.flatnonzero(self.alive[:self.count])
+                    order = rows[np.argsort(self.assign[rows], kind="stable")]
+                    offsets = np.searchsorted(self.assign[order], np.arange(len(self.centroids) + 1))
+                    self.lists = (order, offsets)
+                order, offsets = self.lists
+                probes = min(self.probes, len(self.centroids))
+                nearest = np.argpartition(-(self.centroids @ query), probes - 1)[:probes]
+                candidates = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in nearest])
+                scores = self.vectors[candidates] @ query
+            else:
+                candidates = np.arange(self.count)
+                scores = self.vectors[:self.count] @ query
+                scores[~self.alive[:self.count]] = -np.inf
+        
+        if len(candidates) == 0:
+            return []
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(candidates[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+    
+    def chunks_for(self, rows):
+        """url, title and text for stored rows, keyed by row"""
+        with closing(self.connect()) as connection:
+            placeholders = ",".join("?" * len(rows))
+            found = connection.execute(
+                f"SELECT chunks.row, chunks.url, pages.title, chunks.text FROM chunks "
+                f"JOIN pages ON pages.url = chunks.url WHERE chunks.row IN ({placeholders})", rows
+            ).fetchall()
+        return {row: {"url": url, "title": title, "text": text} for row, url, title, text in found}
+
+
+class PageIndex:
+    """Local semantic index of visited pages for answering from browsing history.
+    
+    Page text is split into chunks and embedded through Ollama's /api/embed, in
+    batches, into an EmbeddingStore. Unchanged pages are skipped and chunks seen
+    before (on this or any other page) reuse their stored vector. `search`
+    embeds a question and returns the closest chunks by cosine similarity.
+    """
+    # Chunks less similar than this to the question are left out
+    min_score = 0.35
+    # Chunks per /api/embed request
+    batch_size = 32
+    
+    def __init__(self, client, directory, model="nomic-embed-text", max_pages=2000):
+        self.client = client
+        self.model = model
+        self.max_pages = max_pages
+        self.store = EmbeddingStore(directory, model)
+    
+    def embed(self, texts):
+        """Unit-length float32 embedding vectors for a list of texts, one row each"""
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            response = self.client.post(
+                "/api/embed", json={"model": self.model, "input": texts[start:start + self.batch_size]}
+            )
+            response.raise_for_status()
+            vectors.extend(response.json()["embeddings"])
+        matrix = np.asarray(vectors, dtype=np.float32)
+        return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    
+    def index_page(self, url, title, chunks):
+        """Embed and store a page's chunks; returns how many needed embedding (0 if unchanged)"""
+        page_hash = hashlib.sha256("\n\n".join(chunks).encode("utf-8")).hexdigest()
+        if not chunks or self.store.page_hash(url) == page_hash:
+            return 0
+        
+        hashes = [hashlib.sha256(chunk.encode("utf-8")).hexdigest() for chunk in chunks]
+        known = self.store.known_vectors(hashes)
+        missing = list(dict.fromkeys(h for h in hashes if h not in known))
+        if missing:
+            texts = {h: chunk for h, chunk in zip(hashes, chunks)}
+            known.update(zip(missing, self.embed([texts[h] for h in missing])))
+        
+        matrix = np.stack([known[h] for h in hashes])
+        self.store.replace_page(url, title, page_hash, chunks, hashes, matrix)
+        self.store.remove_oldest_pages(self.max_pages)
+        
+        if self.store.needs_index():
+            self.store.build_index()
+        return len(missing)
+    
+    def search(self, query, k=4):
+        """Chunks most relevant to query, best first, as dicts with url, title, text and score"""
+        matches = [(row, score) for row, score in self.store.search(self.embed([query])[0], k) if score >= self.min_score]
+        if not matches:
+            return []
+        chunks = self.store.chunks_for([row for row, _ in matches])
+        return [dict(chunks[row], score=score) for row, score in matches if row in chunks]
+    
+    def close(self):
+        self.store.close()
+
+
+class TaskSignals(QObject):
+    """Signals for a BackgroundTask (QRunnable can't define its own)"""
+    result = pyqtSignal(object)
+    error = pyqtSignal(str)
+
+
+class BackgroundTask(QRunnable):
+    """Runs a blocking function on a thread pool and reports the outcome through signals"""
+    def __init__(self, fn):
+        super().__init__()
+        self.fn = fn
+        self.signals = TaskSignals()
+    
+    def run(self):
+        try:
+            result = self.fn()
+        except Exception as e:
+            self.signals.error.emit(str(e))
+        else:
+            self.signals.result.emit(result)
+
+
+class OllamaService(QObject):
+    """Runs Ollama requests off the GUI thread.
+    
+    Results are delivered through queued signals, so the callbacks run on the
+    GUI thread and may touch widgets.
+    """
+    def __init__(self, client, parent=None):
+        super().__init__(parent)
+        self.client = client
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(4)
+        # Keep the signal objects alive until their task has reported back
+        self.active = set()
+    
+    def submit(self, fn, on_result=None, on_error=None):
+        """Run fn() in the background and call on_result/on_error with its outcome"""
+        task = BackgroundTask(fn)
+        signals = task.signals
+        self.active.add(signals)
+        
+        if on_result:
+            signals.result.connect(on_result)
+        if on_error:
+            signals.error.connect(on_error)
+        signals.result.connect(lambda _: self.active.discard(signals))
+        signals.error.connect(lambda _: self.active.discard(signals))
+        
+        self.pool.start(task)
+        return task
+    
+    def fetch_models(self, on_result, on_error=None, retries=None):
+        """List the installed models (the "models" array of /api/tags)"""
+        def fetch():
+            response = self.client.get("/api/tags", retries=retries)
+            response.raise_for_status()
+            return response.json().get("models", [])
+        
+        return self.submit(fetch, on_result, on_error)
+    
+    def load_model(self, model, keep_alive, unload=None, on_result=None, on_error=None, num_ctx=None):
+        """Load a model into memory without generating anything.
+        
+        If `unload` names another model it is evicted first, so both never have
+        to fit in RAM at once. on_result receives the load time in seconds. Pass
+        the `num_ctx` chats will use, or the first chat reloads the model.
+        """
+        def load():
+            if unload:
+                try:
+                    self.client.post("/api/generate", json={"model": unload, "keep_alive": 0}, retries=0).close()
+                except requests.exceptions.RequestException:
+                    pass
+            
+            started = time.monotonic()
+            payload = {"model": model, "keep_alive": keep_alive}
+            if num_ctx:
+                payload["options"] = {"num_ctx": num_ctx}
+            response = self.client.post("/api/generate", json=payload)
+            response.raise_for_status()
+            return time.monotonic() - started
+        
+        return self.submit(load, on_result, on_error)
+
+
+class ModelRegistry(QObject):
+    """In-memory cache of the installed models and their /api/show details.
+    
+    The /api/tags list is kept for `ttl` seconds and refreshed in the background;
+    `models_changed` fires whenever the set of installed models changes. Details
+    are cached per model digest, so they survive renames and are refetched only
+    when a model is re-pulled.
+    """
+    models_changed = pyqtSignal(list)
+    details_ready = pyqtSignal(str)
+    
+    def __init__(self, service, ttl=60, parent=None):
+        super().__init__(parent)
+        self.service = service
+        self.ttl = ttl
+        self.models = {}  # name -> /api/tags entry
+        self.details = {}  # digest -> parsed /api/show details
+        self.fetched_at = None
+        self.refreshing = False
+        self.waiting = []  # (on_result, on_error) callbacks for the running refresh
+        self.pending_details = set()
+        
+        self.timer = QTimer(self)
+        self.timer.setInterval(ttl * 1000)
+        self.timer.timeout.connect(lambda: self.refresh(force=True))
+        self.timer.start()
+    
+    def is_fresh(self):
+        return self.fetched_at is not None and time.monotonic() - self.fetched_at < self.ttl
+    
+    def refresh(self, force=False, on_result=None, on_error=None, retries=None):
+        """Make sure the model list is current and call on_result with the /api/tags entries.
+        
+        A fresh cache answers immediately without touching the network.
+        """
+        if self.is_fresh() and not force:
+            if on_result:
+                on_result(list(self.models.values()))
+            return
+        
+        self.waiting.append((on_result, on_error))
+        if self.refreshing:
+            return
+        
+        self.refreshing = True
+        self.service.fetch_models(self.on_models_fetched, self.on_refresh_failed, retries=retries)
+    
+    def on_models_fetched(self, models):
+        self.refreshing = False
+        changed = self.fetched_at is None or {m["name"] for m in models} != set(self.models)
+        self.models = {model["name"]: model for model in models}
+        self.fetched_at = time.monotonic()
+        
+        waiting, self.waiting = self.waiting, []
+        for on_result, _ in waiting:
+            if on_result:
+                on_result(list(models))
+        
+        if changed:
+            self.models_changed.emit(list(self.models))
+        
+        # Look up details for anything we haven't seen before
+        for model in models:
+            if model.get("digest") not in self.details:
+                self.fetch_details(model["name"])
+    
+    def on_refresh_failed(self, error):
+        self.refreshing = False
+        waiting, self.waiting = self.waiting, []
+        for _, on_error in waiting:
+            if on_error:
+                on_error(error)
+    
+    def installed(self):
+        """Names of the installed models, as of the last refresh"""
+        return list(self.models)
+    
+    def resolve(self, name):
+        """Return the installed model name for `name` ("llava" -> "llava:latest"), or None"""
+        if name in self.models:
+            return name
+        if ":" not in name and f"{name}:latest" in self.models:
+            return f"{name}:latest"
+        return None
+    
+    def is_installed(self, name):
+        return self.resolve(name) is not None
+    
+    def digest(self, name):
+        """Digest of an installed model, which changes when it is re-pulled"""
+        resolved = self.resolve(name)
+        if resolved is None:
+            return None
+        return self.models[resolved].get("digest")
+    
+    def supports_vision(self, name):
+        """True/False from the model's reported capabilities, None if not known yet"""
+        details = self.get_details(name)
+        if details is None:
+            return None
+        return details["vision"]
+    
+    def vision_models(self):
+        """Installed models known to accept images"""
+        return [name for name in self.models if self.supports_vision(name)]
+    
+    def get_details(self, name):
+        """Cached details for an installed model, or None if not fetched yet"""
+        resolved = self.resolve(name)
+        if resolved is None:
+            return None
+        return self.details.get(self.models[resolved].get("digest"))
+    
+    def fetch_details(self, name, on_result=None, on_error=None):
+        """Fetch /api/show details for a model in the background"""
+        resolved = self.resolve(name) or name
+        if resolved in self.pending_details and not on_result:
+            return
+        self.pending_details.add(resolved)
+        
+        def fetch():
+            response = self.service.client.post("/api/show", json={"model": resolved})
+            response.raise_for_status()
+            return self.parse_details(response.json())
+        
+        def done(details):
+            self.pending_details.discard(resolved)
+            digest = self.models.get(resolved, {}).get("digest") or resolved
+            details["size"] = self.models.get(resolved, {}).get("size", 0)
+            self.details[digest] = details
+            self.details_ready.emit(resolved)
+            if on_result:
+                on_result(details)
+        
+        def failed(error):
+            self.pending_details.discard(resolved)
+            if on_error:
+                on_error(error)
+        
+        self.service.submit(fetch, done, failed)
+    
+    def parse_details(self, data):
+        """Pick the fields we care about out of an /api/show response"""
+        model_info = data.get("model_info") or {}
+        details = data.get("details") or {}
+        
+        context_length = None
+        for key, value in model_info.items():
+            if key.endswith(".context_length"):
+                context_length = value
+                break
+        
+        capabilities = data.get("capabilities") or []
+        projector_info = data.get("projector_info") or {}
+        
+        # Newer servers list "vision" as a capability; older ones only expose the
+        # projector (llava style) or vision tensors in the model info (mllama style)
+        vision = ("vision" in capabilities or bool(projector_info)
+                  or any(".vision." in key for key in model_info))
+        
+        return {
+            "capabilities": capabilities,
+            "vision": vision,
+            "context_length": context_length,
+            "quantization": details.get("quantization_level", ""),
+            "family": details.get("family", ""),
+            "parameter_size": details.get("parameter_size", ""),
+            "projector_info": projector_info,
+            "model_info": model_info,
+        }
+
+
+class ChatEngine:
+    """Builds /api/chat requests from the conversation history and reads the replies.
+    
+    The history is sent as structured messages exactly as it was stored, so every
+    request starts with the same tokens as the previous one and Ollama can reuse
+    its KV cache instead of re-evaluating the whole conversation each turn.
+    """
+    path = "/api/chat"
+    
+    # System prompt for chat turns. It always goes first and never changes
+    # within a conversation, so Ollama can reuse the evaluated prefix between
+    # turns and between conversations.
+    default_system_prompt = (
+        "You are the AI assistant built into the Glitch Create web browser, running locally through Ollama.\n\n"
+        "You can control the browser! When you want to open a website, use this format: [OPEN_URL: https://example.com].\n"
+        "You can also naturally suggest websites by saying things like \"I'll open https://example.com for you\" or "
+        "\"Let me navigate to https://wikipedia.org\" and the browser will automatically open them.\n"
+        "Be helpful and proactively open relevant websites when users ask for them."
+    )
+    # Per-model system prompts, matched against the start of the model name
+    system_prompts = {}
+    
+    def __init__(self, system_prompts=None):
+        self.system_prompts = dict(self.system_prompts)
+        if system_prompts:
+            self.system_prompts.update(system_prompts)
+    
+    def system_prompt(self, model):
+        """System prompt for a model; the longest matching name prefix wins"""
+        matches = [name for name in self.system_prompts if model.startswith(name)]
+        if matches:
+            return self.system_prompts[max(matches, key=len)]
+        return self.default_system_prompt
+    
+    def build_payload(self, messages, model, image_base64=None, stream=True, keep_alive=None, system=None,
+                      num_ctx=None):
+        """Create the JSON body for a chat request.
+        
+        `num_ctx` sets the context window Ollama runs the model with; without it
+        the server's default (often 2048 tokens) silently cuts the prompt.
+        """
+        api_messages = [{"role": msg["role"], "content": msg["content"]} for msg in messages]
+        if system:
+            api_messages.insert(0, {"role": "system", "content": system})
+        
+        # Images only ride along with the newest user turn, older turns stay byte-identical
+        if image_base64 and api_messages:
+            api_messages[-1]["images"] = [image_base64]
+        
+        payload = {
+            "model": model,
+            "messages": api_messages,
+            "stream": stream
+        }
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        if num_ctx:
+            payload["options"] = {"num_ctx": num_ctx}
+        return payload
+    
+    def message_text(self, data):
+        """Extract the assistant text from a (partial) chat response"""
+        return data.get("message", {}).get("content", "")
+
+
+class ContextManager:
+    """Keeps the messages sent to the model inside a per-model token budget.
+    
+    When a conversation outgrows the budget, old page dumps and screenshot
+    requests are replaced by a one-line stub first. If that is not enough, the
+    oldest turns are folded into a rolling summary that is sent in their place.
+    The summary starts out as a cheap extract and is replaced by a model-written
+    one once the background summarization call returns.
+    """
+    chars_per_token = 4
+    message_overhead = 4
+    default_budget = 4096
+    # Prompt budgets in tokens, matched against the start of the model name
+    # (the settings' [context] group adds to and overrides these)
+    model_budgets = {
+        "llama3.2-vision": 8192,
+        "llama3.2": 8192,
+        "llama3.1": 8192,
+        "llava": 4096,
+        "bakllava": 4096,
+        "mistral": 8192,
+        "phi3": 4096,
+        "gemma2": 8192,
+        "qwen2.5": 8192,
+    }
+    # Tokens kept free for the model's reply
+    reply_reserve = 1024
+    # After compacting, aim for this fraction of the budget so it doesn't happen every turn
+    compact_target = 0.6
+    # The stand-in summary never takes more than this fraction of the budget
+    summary_share = 0.25
+    
+    def __init__(self, budgets=None):
+        self.budgets = dict(self.model_budgets)
+        if budgets:
+            self.budgets.update(budgets)
+        self.summary_version = 0
+        self.reset()
+    
+    def reset(self):
+        """Forget the summary, e.g. after the chat was cleared"""
+        self.summary = ""
+        self.summarized_count = 0
+        # Bumped so summaries requested before the reset are ignored
+        self.summary_version += 1
+    
+    def limit_budget(self, model, tokens):
+        """Make sure a model's budget never exceeds its real context length"""
+        self.budgets[model] = min(self.context_size(model), tokens)
+    
+    def context_size(self, model):
+        """Configured context size in tokens for a model"""
+        budget = self.budgets.get(model)
+        if budget is None:
+            # Longest matching prefix wins, so "llama3.2-vision" beats "llama3.2"
+            matches = [name for name in self.budgets if model.startswith(name)]
+            budget = self.budgets[max(matches, key=len)] if matches else self.default_budget
+        return budget
+    
+    def page_chars(self, model, share=0.5):
+        """Characters of page content one message may use for a model"""
+        return int(self.budget_for(model) * share) * self.chars_per_token
+    
+    def budget_for(self, model):
+        """Return the usable prompt budget in tokens for a model"""
+        budget = self.context_size(model)
+        return max(budget - self.reply_reserve, budget // 2)
+    
+    def estimate_tokens(self, message):
+        """Rough token count for a single message"""
+        return len(self.message_content(message)) // self.chars_per_token + self.message_overhead
+    
+    def message_content(self, message):
+        """Content actually sent for a message, honouring evicted page dumps"""
+        if message.get("evicted"):
+            return message.get("stub", "[Earlier content omitted]")
+        return message["content"]
+    
+    def build(self, history, model, system_prompt=""):
+        """Return (messages, summary_job) for the next request.
+        
+        `messages` fits the model's budget, leaving room for the system prompt
+        that is sent ahead of them. `summary_job` is None, or a dict with the
+        "messages" for a background summarization call and the summary
+        "version" to pass back to `set_summary` with its result.
+        """
+        if self.summarized_count > len(history):
+            self.reset()
+        
+        budget = self.budget_for(model) - len(system_prompt) // self.chars_per_token
+        recent = history[self.summarized_count:]
+        
+        if self.total_tokens(recent) > budget:
+            # Page dumps and screenshots are the cheapest thing to lose, oldest first
+            for message in recent[:-1]:
+                if message.get("kind") in ("page", "screenshot") and not message.get("evicted"):
+                    message["evicted"] = True
+                    if self.total_tokens(recent) <= budget:
+                        break
+        
+        summary_job = None
+        if self.total_tokens(recent) > budget:
+            folded = []
+            target = int(budget * self.compact_target)
+            while len(recent) > 1 and self.total_tokens(recent) > target:
+                folded.append(recent.pop(0))
+            # Never start the kept part with an assistant reply
+            while len(recent) > 1 and recent[0]["role"] == "assistant":
+                folded.append(recent.pop(0))
+            
+            if folded:
+                summary_job = {
+                    "messages": self.summary_request(self.summary, folded),
+                    "version": self.summary_version + 1
+                }
+                self.summarized_count += len(folded)
+                max_chars = int(budget * self.summary_share) * self.chars_per_token
+                self.summary = self.extract_summary(self.summary, folded, max_chars)
+                self.summary_version += 1
+        
+        messages = []
+        if self.summary:
+            messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{self.summary}"
+            })
+        for message in recent:
+            messages.append({"role": message["role"], "content": self.message_content(message)})
+        
+        return messages, summary_job
+    
+    def total_tokens(self, messages):
+        summary_tokens = len(self.summary) // self.chars_per_token if self.summary else 0
+        return summary_tokens + sum(self.estimate_tokens(message) for message in messages)
+    
+    def extract_summary(self, summary, folded, max_chars=None):
+        """Cheap stand-in summary used until the model-written one arrives.
+        
+        With max_chars, its oldest lines are dropped to stay within that size,
+        so it can't grow without end when model-written summaries never arrive.
+        """
+        lines = summary.split("\n") if summary else []
+        for message in folded:
+            text = " ".join(self.message_content(message).split())
+            if len(text) > 200:
+                text = text[:200] + "..."
+            lines.append(f"{message['role']}: {text}")
+        if max_chars is not None:
+            total = sum(len(line) + 1 for line in lines)
+            while len(lines) > 1 and total > max_chars:
+                total -= len(lines.pop(0)) + 1
+        return "\n".join(lines)
+    
+    def summary_request(self, summary, folded):
+        """Build the messages for the background summarization call"""
+        transcript = "\n\n".join(
+            f"{message['role'].capitalize()}: {self.message_content(message)}" for message in folded
+        )
+        return [{
+            "role": "user",
+            "content": "Write a concise summary of this conversation so it can replace the original messages. "
+                       "Keep names, URLs, facts and decisions; drop pleasantries.\n\n"
+                       f"Existing summary:\n{summary or '(none)'}\n\n"
+                       f"New messages:\n{transcript}"
+        }]
+    
+    def set_summary(self, summary, version):
+        """Install a model-written summary, unless more was folded in since it was requested"""
+        if version == self.summary_version and summary.strip():
+            self.summary = summary.strip()
+
+
+class AIJobScheduler(QObject):
+    """Queues AI requests and runs a limited number of them at a time.
+    
+    Jobs are taken in FIFO order within a priority, with jobs for the active tab
+    ahead of those for background tabs. At most `max_parallel` run at once, which
+    should match the server's OLLAMA_NUM_PARALLEL, and only one job per group
+    (e.g. one conversation) runs at a time so replies stay in order.
+    
+    A job's `start` callable is only called when the job is dispatched and
+    returns an unstarted worker with finished/error/cancelled signals and a
+    cancel() method, or None to skip the job.
+    """
+    PRIORITY_CHAT = 0
+    PRIORITY_BACKGROUND = 10
+    
+    queue_changed = pyqtSignal()
+    
+    def __init__(self, max_parallel=1, parent=None):
+        super().__init__(parent)
+        self.max_parallel = max(1, max_parallel)
+        self.queue = []
+        self.running = []
+        # Workers that reported back but whose thread may still be winding down
+        self.retired = []
+        self.next_id = 0
+        self.active_tab = None
+    
+    def submit(self, start, priority=PRIORITY_CHAT, group=None, tab=None, on_cancel=None):
+        """Queue a job and start it as soon as a slot is free.
+        
+        on_cancel is called if the job is dropped from the queue before it starts.
+        """
+        self.next_id += 1
+        job = {
+            'id': self.next_id,
+            'start': start,
+            'priority': priority,
+            'group': group,
+            'tab': tab,
+            'on_cancel': on_cancel,
+            'worker': None
+        }
+        self.queue.append(job)
+        self.dispatch()
+        return job
+    
+    def set_active_tab(self, tab):
+        self.active_tab = tab
     
-    def run(self):
-        try:
-            self.progress.emit("Detecting your operating system...")
+    def dispatch(self):
+        """Start queued jobs while there are free slots"""
+        while len(self.running) < self.max_parallel:
+            busy = {job['group'] for job in self.running if job['group']}
+            candidates = [job for job in self.queue if job['group'] is None or job['group'] not in busy]
+            if not candidates:
+                break
             
-            if self.system == "Windows":
-                self.install_windows()
-            elif self.system == "Darwin":  # macOS
-                self.install_macos()
-            elif self.system == "Linux":
-                self.install_linux()
-            else:
-                self.finished.emit(False, f"Unsupported OS: {self.system}")
-        except Exception as e:
-            self.finished.emit(False, f"Installation failed: {str(e)}")
+            job = min(candidates, key=lambda j: (j['priority'], j['tab'] is not self.active_tab, j['id']))
+            self.queue.remove(job)
+            
+            worker = job['start']()
+            if worker is None:
+                continue
+            
+            job['worker'] = worker
+            self.running.append(job)
+            worker.finished.connect(lambda *args, j=job: self.on_job_done(j))
+            worker.error.connect(lambda *args, j=job: self.on_job_done(j))
+            worker.cancelled.connect(lambda *args, j=job: self.on_job_done(j))
+            worker.start()
+        
+        self.queue_changed.emit()
     
-    def install_windows(self):
-        self.progress.emit("Downloading Ollama for Windows...")
-        
-        url = "https://ollama.com/download/OllamaSetup.exe"
-        installer_path = os.path.join(os.environ.get("TEMP", "."), "OllamaSetup.exe")
-        
-        response = requests.get(url, stream=True)
-        total_size = int(response.headers.get('content-length', 0))
-        
-        with open(installer_path, 'wb') as f:
-            downloaded = 0
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-                    downloaded += len(chunk)
-                    if total_size > 0:
-                        percent = int((downloaded / total_size) * 100)
-                        self.progress.emit(f"Downloading... {percent}%")
-        
-        self.progress.emit("Running installer...")
-        subprocess.run([installer_path, "/S"], check=True)
-        
-        self.progress.emit("Installation complete! Starting Ollama...")
-        subprocess.Popen(["ollama", "serve"], 
-                        creationflags=subprocess.CREATE_NO_WINDOW if self.system == "Windows" else 0)
-        
-        self.finished.emit(True, "Ollama installed successfully!")
+    def on_job_done(self, job):
+        if job in self.running:
+            self.running.remove(job)
+            self.retired = [worker for worker in self.retired if not worker.isFinished()]
+            self.retired.append(job['worker'])
+            self.dispatch()
     
-    def install_macos(self):
-        self.progress.emit("Downloading Ollama for macOS...")
-        
-        url = "https://ollama.com/download/Ollama-darwin.zip"
-        installer_path = "/tmp/Ollama.zip"
-        
-        response = requests.get(url, stream=True)
-        with open(installer_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-        
-        self.progress.emit("Installing...")
-        subprocess.run(["unzip", "-o", installer_path, "-d", "/Applications/"], check=True)
-        
-        self.progress.emit("Starting Ollama...")
-        subprocess.Popen(["/Applications/Ollama.app/Contents/MacOS/ollama", "serve"])
-        
-        self.finished.emit(True, "Ollama installed successfully!")
+    def cancel(self, job):
+        """Drop a queued job, or stop a running one"""
+        if job in self.queue:
+            self.queue.remove(job)
+            if job['on_cancel']:
+                job['on_cancel']()
+            self.queue_changed.emit()
+        elif job in self.running:
+            job['worker'].cancel()
     
-    def install_linux(self):
-        self.progress.emit("Installing Ollama for Linux...")
-        
-        install_script = subprocess.check_output(
-            ["curl", "-fsSL", "https://ollama.com/install.sh"]
-        )
-        
-        subprocess.run(["sh", "-c", install_script.decode()], check=True)
-        
-        self.progress.emit("Starting Ollama...")
-        subprocess.Popen(["ollama", "serve"])
-        
-        self.finished.emit(True, "Ollama installed successfully!")
+    def cancel_foreground(self):
+        """Cancel every job the user is waiting on, leaving background work alone"""
+        for job in self.queue[:] + self.running[:]:
+            if job['priority'] == self.PRIORITY_CHAT:
+                self.cancel(job)
+    
+    def cancel_group(self, group):
+        """Cancel every queued and running job of a group"""
+        for job in self.queue[:] + self.running[:]:
+            if job['group'] == group:
+                self.cancel(job)
+    
+    def cancel_all(self):
+        for job in self.queue[:] + self.running[:]:
+            self.cancel(job)
+    
+    def pending(self, group=None):
+        """Number of queued and running jobs, optionally only for one group"""
+        jobs = self.queue + self.running
+        if group is not None:
+            jobs = [job for job in jobs if job['group'] == group]
+        return len(jobs)
 
 
 class OllamaWorker(QThread):
@@ -248,108 +2313,742 @@ class OllamaWorker(QThread):
     finished = pyqtSignal(str)
     error = pyqtSignal(str)
     streaming = pyqtSignal(str)
+    cancelled = pyqtSignal(str)
+    
+    # Minimum seconds between streaming emits, so the GUI gets batches instead of one signal per token
+    stream_interval = 0.05
     
-    def __init__(self, messages, model, image_base64=None):
+    def __init__(self, client, messages, model, image_base64=None, stream=True, keep_alive=None, system=None,
+                 num_ctx=None):
         super().__init__()
+        self.client = client
         self.messages = messages
         self.model = model
         self.image_base64 = image_base64
+        self.stream = stream
+        self.keep_alive = keep_alive
+        self.system = system
+        self.num_ctx = num_ctx
+        self.engine = ChatEngine()
+        self.is_cancelled = False
+        self.handle = RequestHandle()
+        self.response = None
+        self.parts = []
+    
+    def cancel(self):
+        """Stop the request; dropping the connection makes Ollama stop generating too"""
+        self.is_cancelled = True
+        # Also aborts a request still waiting for its first chunk or backing off between retries
+        self.handle.cancel()
+        if self.response is not None:
+            try:
+                self.response.close()
+            except Exception:
+                pass
     
     def run(self):
         try:
-            vision_models = ["llava", "bakllava", "llava-phi3", "llama3.2-vision"]
-            supports_vision = any(vm in self.model.lower() for vm in vision_models)
-            
-            if self.image_base64 and supports_vision:
-                prompt = ""
-                for msg in self.messages:
-                    role = msg["role"]
-                    content = msg["content"]
-                    if role == "user":
-                        prompt += f"User: {content}\n\n"
-                    elif role == "assistant":
-                        prompt += f"Assistant: {content}\n\n"
-                
-                prompt += "Assistant: "
-                
-                response = requests.post(
-                    "http://localhost:11434/api/generate",
-                    json={
-                        "model": self.model,
-                        "prompt": prompt,
-                        "images": [self.image_base64],
-                        "stream": False
-                    },
-                    timeout=120
-                )
-            else:
-                prompt = ""
-                for msg in self.messages:
-                    role = msg["role"]
-                    content = msg["content"]
-                    if role == "user":
-                        prompt += f"User: {content}\n\n"
-                    elif role == "assistant":
-                        prompt += f"Assistant: {content}\n\n"
-                
-                prompt += "Assistant: "
-                
-                response = requests.post(
-                    "http://localhost:11434/api/generate",
-                    json={
-                        "model": self.model,
-                        "prompt": prompt,
-                        "stream": False
-                    },
-                    timeout=120
-                )
+            # Callers only pass an image when the model is known to support vision
+            payload = self.engine.build_payload(
+                self.messages, self.model, self.image_base64, self.stream, self.keep_alive, self.system,
+                self.num_ctx
+            )
+            
+            response = self.client.post(self.engine.path, json=payload, stream=self.stream, handle=self.handle)
+            self.response = response
+            
+            if self.is_cancelled:
+                response.close()
+                self.cancelled.emit("")
+                return
             
             if response.status_code == 200:
-                data = response.json()
-                assistant_message = data["response"]
-                self.finished.emit(assistant_message)
+                if self.stream:
+                    try:
+                        self.read_stream(response)
+                    finally:
+                        response.close()
+                else:
+                    data = response.json()
+                    if self.is_cancelled:
+                        self.cancelled.emit("")
+                        return
+                    assistant_message = self.engine.message_text(data)
+                    self.finished.emit(assistant_message)
             else:
                 error_detail = response.text
                 try:
-                    error_json = response.json()
-                    error_detail = error_json.get("error", {}).get("message", response.text)
+                    error_detail = response.json().get("error", response.text)
                 except:
                     pass
                 self.error.emit(f"Ollama Error ({response.status_code}): {error_detail}")
-        except requests.exceptions.ConnectionError:
-            self.error.emit("Cannot connect to Ollama. Make sure Ollama is running!\n\nStart it with: ollama serve")
-        except requests.exceptions.Timeout:
-            self.error.emit("Request timed out. The model might be too large or your computer is slow.")
         except Exception as e:
-            self.error.emit(f"Error: {str(e)}")
+            if self.is_cancelled:
+                # Closing the stream from the GUI thread interrupts the read
+                self.cancelled.emit("".join(self.parts))
+            elif isinstance(e, requests.exceptions.ConnectionError):
+                self.error.emit("Cannot connect to Ollama. Make sure Ollama is running!\n\nStart it with: ollama serve")
+            elif isinstance(e, requests.exceptions.Timeout):
+                self.error.emit("Request timed out. The model might be too large or your computer is slow.")
+            else:
+                self.error.emit(f"Error: {str(e)}")
+    
+    def read_stream(self, response):
+        """Read NDJSON chunks as they arrive and emit the partial text in batches"""
+        parts = self.parts
+        pending = ""
+        last_emit = 0.0
+        
+        for line in response.iter_lines():
+            if self.is_cancelled:
+                self.cancelled.emit("".join(parts))
+                return
+            if not line:
+                continue
+            
+            data = json.loads(line)
+            if data.get("error"):
+                self.error.emit(f"Ollama Error: {data['error']}")
+                return
+            
+            pending += self.engine.message_text(data)
+            done = data.get("done", False)
+            
+            # The first chunk goes out immediately, later ones are batched
+            now = time.monotonic()
+            if pending and (done or now - last_emit >= self.stream_interval):
+                self.streaming.emit(pending)
+                parts.append(pending)
+                pending = ""
+                last_emit = now
+            
+            if done:
+                break
+        
+        # Closing the response can also just end the iteration; a cut-off reply isn't a finished one
+        if self.is_cancelled:
+            self.cancelled.emit("".join(parts))
+            return
+        
+        if pending:
+            self.streaming.emit(pending)
+            parts.append(pending)
+        
+        self.finished.emit("".join(parts))
+
+
+class MapReduceAnalysis(QObject):
+    """Sends one request per part through the AI scheduler.
+    
+    Each part streams its answer and the worker collects the text, so Stop
+    can drop the connection mid-answer. Parts run as parallel as the
+    scheduler allows; `finished` delivers the answers in part order once all
+    are in. A part that fails gets a short note instead of an answer, so one
+    bad part doesn't sink the rest.
+    """
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(list)
+    cancelled = pyqtSignal()
+    
+    def __init__(self, scheduler, client, model, parts, keep_alive=None, tab=None, num_ctx=None, parent=None):
+        """parts is a list of (messages, image_base64) pairs"""
+        super().__init__(parent)
+        self.scheduler = scheduler
+        self.client = client
+        self.model = model
+        self.parts = parts
+        self.keep_alive = keep_alive
+        self.num_ctx = num_ctx
+        self.tab = tab
+        self.results = [None] * len(parts)
+        self.done = 0
+        self.is_cancelled = False
+    
+    def start(self):
+        self.progress.emit(0, len(self.parts))
+        for index in range(len(self.parts)):
+            self.scheduler.submit(
+                lambda index=index: self.start_part(index),
+                priority=AIJobScheduler.PRIORITY_CHAT,
+                tab=self.tab,
+                on_cancel=self.cancel
+            )
+    
+    def start_part(self, index):
+        if self.is_cancelled:
+            return None
+        messages, image_base64 = self.parts[index]
+        worker = OllamaWorker(
+            self.client, messages, self.model,
+            image_base64=image_base64, stream=True, keep_alive=self.keep_alive, num_ctx=self.num_ctx
+        )
+        worker.finished.connect(lambda text: self.on_part_done(index, text))
+        worker.error.connect(lambda error: self.on_part_done(index, f"(could not analyze this part: {error})"))
+        worker.cancelled.connect(lambda partial: self.cancel())
+        return worker
+    
+    def on_part_done(self, index, text):
+        if self.is_cancelled:
+            return
+        self.results[index] = text
+        self.done += 1
+        self.progress.emit(self.done, len(self.parts))
+        if self.done == len(self.parts):
+            self.finished.emit(self.results)
+    
+    def cancel(self):
+        if not self.is_cancelled:
+            self.is_cancelled = True
+            self.cancelled.emit()
+
+
+class MarkdownRenderer:
+    """Parses Markdown streamed in pieces, one block at a time.
+    
+    Text is split into blocks at blank lines, headings and code fences. A
+    finished block is parsed once and never looked at again; only the
+    unfinished block at the end is parsed again as more text arrives, so a long
+    reply costs linear time rather than re-parsing everything per token. Long
+    code blocks are handed out in pieces for the same reason.
+    
+    Blocks come out as tuples for ChatView to lay out: ("p", html),
+    ("heading", level, html), ("code", lines), ("list", ordered, [html]),
+    ("quote", html) and ("table", [[html]]). Inline html is escaped, with
+    only code, bold, italics and http(s) links added.
+    """
+    code_piece_lines = 30
+    
+    list_item = re.compile(r"^\s*([-*+]|\d+[.)])\s+(.*)$")
+    heading = re.compile(r"^(#{1,6})\s+(.*?)(?:\s+#+)?$")
+    table_rule = re.compile(r"^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?\s*$")
+    
+    def __init__(self):
+        self.lines = []  # complete lines of the unfinished block
+        self.partial = ""  # text after the last newline
+        self.fence = None  # language of the open code fence, "" if none given
+    
+    def feed(self, text):
+        """Add text; returns (newly finished blocks, blocks of the unfinished tail)"""
+        finished = []
+        *complete, self.partial = (self.partial + text).split("\n")
+        for line in complete:
+            finished.extend(self.add_line(line))
+        return finished, self.render_tail()
+    
+    def finish(self):
+        """End of the text: returns every block not handed out yet"""
+        finished = []
+        if self.partial:
+            finished.extend(self.add_line(self.partial))
+            self.partial = ""
+        if self.fence is not None:
+            if self.lines:
+                finished.append(self.render_code(self.lines))
+            self.fence = None
+        elif self.lines:
+            finished.append(self.render_block(self.lines))
+        self.lines = []
+        return finished
+    
+    def add_line(self, line):
+        """Take one complete line, returning any blocks it finishes"""
+        stripped = line.strip()
+        
+        if self.fence is not None:
+            if stripped.startswith("```"):
+                lines, self.lines, self.fence = self.lines, [], None
+                return [self.render_code(lines)] if lines else []
+            self.lines.append(line)
+            if len(self.lines) >= self.code_piece_lines:
+                lines, self.lines = self.lines, []
+                return [self.render_code(lines)]
+            return []
+        
+        finished = []
+        heading = self.heading.match(stripped)
+        if stripped.startswith("```") or not stripped or heading:
+            if self.lines:
+                finished.append(self.render_block(self.lines))
+                self.lines = []
+            if stripped.startswith("```"):
+                self.fence = stripped[3:].strip()
+            elif heading:
+                finished.append(self.render_heading(heading))
+            return finished
+        
+        self.lines.append(line)
+        return finished
+    
+    def render_tail(self):
+        lines = self.lines + ([self.partial] if self.partial else [])
+        if self.fence is not None:
+            return [self.render_code(lines)] if lines else []
+        if self.partial.lstrip().startswith(("#", "```")) and not self.lines:
+            # Could still become a heading or fence, show it as typed for now
+            return [("p", self.inline(self.partial))]
+        return [self.render_block(lines)] if lines else []
+    
+    def render_code(self, lines):
+        return ("code", list(lines))
+    
+    def render_heading(self, match):
+        return ("heading", len(match.group(1)), self.inline(match.group(2).strip()))
+    
+    def render_block(self, lines):
+        if all(self.list_item.match(line) or line.startswith((" ", "\t")) for line in lines) and self.list_item.match(lines[0]):
+            return self.render_list(lines)
+        if all(line.lstrip().startswith(">") for line in lines):
+            return ("quote", "<br>".join(self.inline(line.lstrip()[1:].strip()) for line in lines))
+        if len(lines) >= 2 and "|" in lines[0] and self.table_rule.match(lines[1]):
+            return self.render_table(lines)
+        return ("p", "<br>".join(self.inline(line.strip()) for line in lines))
+    
+    def render_list(self, lines):
+        items = []
+        for line in lines:
+            match = self.list_item.match(line)
+            if match:
+                items.append(match.group(2))
+            else:
+                items[-1] += " " + line.strip()
+        ordered = self.list_item.match(lines[0]).group(1)[0].isdigit()
+        return ("list", ordered, [self.inline(item) for item in items])
+    
+    def render_table(self, lines):
+        rows = []
+        for index, line in enumerate(lines):
+            if index == 1:
+                continue
+            cells = [self.inline(cell.strip()) for cell in line.strip().strip("|").split("|")]
+            rows.append([f"<b>{cell}</b>" for cell in cells] if index == 0 else cells)
+        return ("table", rows)
+    
+    @staticmethod
+    def escape(text):
+        return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+    
+    def inline(self, text):
+        """Escape a line and apply inline code, bold, italics and links"""
+        parts = text.split("`")
+        # Odd-numbered parts are inside backticks (an unmatched backtick stays literal)
+        if len(parts) % 2 == 0:
+            last = parts.pop()
+            parts[-1] += "`" + last
+        html = []
+        for index, part in enumerate(parts):
+            part = self.escape(part)
+            if index % 2:
+                html.append(f'<code style="background-color: #f4f4f4;">{part}</code>')
+                continue
+            part = re.sub(r"\*\*(.+?)\*\*|__(.+?)__", lambda m: f"<b>{m.group(1) or m.group(2)}</b>", part)
+            part = re.sub(r"(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?![\w*])|(?<!\w)_(?!\s)(.+?)(?<!\s)_(?!\w)",
+                          lambda m: f"<i>{m.group(1) or m.group(2)}</i>", part)
+            part = re.sub(r"\[([^\]]+)\]\((https?://[^\s)]+)\)", r'<a href="\2">\1</a>', part)
+            html.append(part)
+        return "".join(html)
+
+
+class ChatView(QTextEdit):
+    """Read-only chat transcript that stays cheap to update in long sessions.
+    
+    Every message lives in its own text frame, so streamed text is inserted at
+    the end of that frame without touching the rest of the document. Streamed
+    text is buffered and flushed at most about 30 times a second, and once there
+    are more than `max_messages` messages the oldest are dropped. The view only
+    follows new text while it is scrolled to the bottom.
+    
+    Messages added with markdown=True are rendered through a MarkdownRenderer
+    as their text arrives: finished blocks are laid out once, and only the
+    unfinished block at the end is replaced on each flush.
+    
+    Messages can carry the key they are saved under. Scrolling to the top
+    emits history_requested, so older messages can be loaded in above the
+    oldest key with at_start=True.
+    """
+    history_requested = pyqtSignal()
+    flush_interval_ms = 33
+    heading_sizes = {1: "x-large", 2: "large"}
+    
+    def __init__(self, max_messages=300, parent=None):
+        super().__init__(parent)
+        self.setReadOnly(True)
+        # The undo stack would otherwise keep every edit for the whole session
+        self.setUndoRedoEnabled(False)
+        self.max_messages = max_messages
+        self.messages = []
+        self.pending = {}  # frame -> list of text waiting for the next flush
+        self.renderers = {}  # frame -> Markdown state of a message still being written
+        self.keys = {}  # frame -> key the message is saved under
+        self.verticalScrollBar().valueChanged.connect(self.on_scrolled)
+        
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(self.flush_interval_ms)
+        self.flush_timer.timeout.connect(self.flush)
+        
+        self.frame_format = QTextFrameFormat()
+        self.frame_format.setBottomMargin(8)
+        
+        self.code_block_format = QTextBlockFormat()
+        self.code_block_format.setBackground(QColor("#f4f4f4"))
+        self.code_block_format.setNonBreakableLines(True)
+        self.code_char_format = QTextCharFormat()
+        self.code_char_format.setFontFixedPitch(True)
+        self.code_char_format.setFontFamilies(["Consolas", "Courier New", "monospace"])
+        self.quote_block_format = QTextBlockFormat()
+        self.quote_block_format.setLeftMargin(12)
+        self.table_format = QTextTableFormat()
+        self.table_format.setBorder(1)
+        self.table_format.setCellSpacing(0)
+        self.table_format.setCellPadding(3)
+    
+    def at_bottom(self):
+        scrollbar = self.verticalScrollBar()
+        return scrollbar.value() >= scrollbar.maximum() - 4
+    
+    def follow(self, was_at_bottom):
+        if was_at_bottom:
+            scrollbar = self.verticalScrollBar()
+            scrollbar.setValue(scrollbar.maximum())
+    
+    def on_scrolled(self, value):
+        scrollbar = self.verticalScrollBar()
+        if value == scrollbar.minimum() and scrollbar.maximum() > scrollbar.minimum():
+            self.history_requested.emit()
+    
+    def oldest_key(self):
+        """Key of the oldest message shown that has one, or None"""
+        for frame in self.messages:
+            if frame in self.keys:
+                return self.keys[frame]
+        return None
+    
+    def set_key(self, frame, key):
+        if key is not None and frame in self.messages:
+            self.keys[frame] = key
+    
+    def add_message(self, html, markdown=False, key=None, at_start=False):
+        """Add a message and return its frame, which streamed text can be added to.
+        
+        With at_start=True the message goes above all others (for loading
+        older history) and nothing is trimmed.
+        """
+        was_at_bottom = self.at_bottom()
+        cursor = QTextCursor(self.document())
+        if not at_start:
+            cursor.movePosition(QTextCursor.MoveOperation.End)
+        frame = cursor.insertFrame(self.frame_format)
+        cursor.insertHtml(html)
+        if at_start:
+            self.messages.insert(0, frame)
+        else:
+            self.messages.append(frame)
+        self.set_key(frame, key)
+        if markdown:
+            self.renderers[frame] = {
+                'renderer': MarkdownRenderer(),
+                # Where the unfinished tail starts, relative to the frame
+                'tail': cursor.position() - frame.firstPosition(),
+                'blocks': 0
+            }
+        if not at_start:
+            self.trim()
+        self.follow(was_at_bottom)
+        return frame
+    
+    def append_text(self, frame, text):
+        """Queue plain text for the end of a message"""
+        self.pending.setdefault(frame, []).append(text)
+        if not self.flush_timer.isActive():
+            self.flush_timer.start()
+    
+    def flush(self):
+        """Write all queued text into its messages"""
+        if not self.pending:
+            return
+        was_at_bottom = self.at_bottom()
+        pending, self.pending = self.pending, {}
+        for frame, parts in pending.items():
+            if frame not in self.messages:
+                continue
+            state = self.renderers.get(frame)
+            if state:
+                finished, tail = state['renderer'].feed("".join(parts))
+                self.render(frame, state, finished, tail)
+            else:
+                cursor = QTextCursor(self.document())
+                cursor.setPosition(frame.lastPosition())
+                cursor.insertText("".join(parts), QTextCharFormat())
+        self.follow(was_at_bottom)
+    
+    def finish_message(self, frame):
+        """Write out everything queued for a message and render its last block"""
+        self.flush()
+        state = self.renderers.pop(frame, None)
+        if state and frame in self.messages:
+            was_at_bottom = self.at_bottom()
+            self.render(frame, state, state['renderer'].finish(), [])
+            self.follow(was_at_bottom)
+    
+    def render(self, frame, state, finished, tail):
+        """Replace a message's tail with newly finished blocks plus the new tail"""
+        cursor = QTextCursor(self.document())
+        # One edit block, so the document is laid out once instead of per inserted line
+        cursor.beginEditBlock()
+        cursor.setPosition(frame.firstPosition() + state['tail'])
+        cursor.setPosition(frame.lastPosition(), QTextCursor.MoveMode.KeepAnchor)
+        cursor.removeSelectedText()
+        
+        for block in finished:
+            self.write_block(cursor, frame, block, state['blocks'] == 0)
+            state['blocks'] += 1
+        state['tail'] = cursor.position() - frame.firstPosition()
+        for index, block in enumerate(tail):
+            self.write_block(cursor, frame, block, state['blocks'] == 0 and index == 0)
+        cursor.endEditBlock()
+    
+    def start_block(self, cursor, block_format, char_format):
+        """Move to a fresh block, reusing the current one if it is empty"""
+        block = cursor.block()
+        if block.length() == 1 and block.textList() is None and cursor.currentTable() is None:
+            cursor.setBlockFormat(block_format)
+            cursor.setBlockCharFormat(char_format)
+            cursor.setCharFormat(char_format)
+        else:
+            cursor.insertBlock(block_format, char_format)
+    
+    def write_block(self, cursor, frame, block, first):
+        """Lay out one parsed Markdown block at the cursor"""
+        kind = block[0]
+        if kind == "p" and first:
+            # A reply that opens with a paragraph starts on the sender's line
+            cursor.insertText(" ", QTextCharFormat())
+            cursor.insertHtml(block[1])
+        elif kind == "p":
+            self.start_block(cursor, QTextBlockFormat(), QTextCharFormat())
+            cursor.insertHtml(block[1])
+        elif kind == "heading":
+            self.start_block(cursor, QTextBlockFormat(), QTextCharFormat())
+            size = self.heading_sizes.get(block[1], "medium")
+            cursor.insertHtml(f'<span style="font-size: {size}; font-weight: bold;">{block[2]}</span>')
+        elif kind == "code":
+            for line in block[1]:
+                self.start_block(cursor, self.code_block_format, self.code_char_format)
+                cursor.insertText(line, self.code_char_format)
+        elif kind == "list":
+            style = QTextListFormat.Style.ListDecimal if block[1] else QTextListFormat.Style.ListDisc
+            for index, item in enumerate(block[2]):
+                if index == 0:
+                    self.start_block(cursor, QTextBlockFormat(), QTextCharFormat())
+                    cursor.createList(style)
+                else:
+                    cursor.insertBlock()
+                cursor.insertHtml(item)
+        elif kind == "quote":
+            self.start_block(cursor, self.quote_block_format, QTextCharFormat())
+            cursor.insertHtml(f'<span style="color: #555555;">{block[1]}</span>')
+        elif kind == "table":
+            rows = block[1]
+            self.start_block(cursor, QTextBlockFormat(), QTextCharFormat())
+            table = cursor.insertTable(len(rows), max(len(row) for row in rows), self.table_format)
+            for row_index, row in enumerate(rows):
+                for column, cell in enumerate(row):
+                    table.cellAt(row_index, column).firstCursorPosition().insertHtml(cell)
+            # Continue in the block Qt keeps after the table
+            cursor.setPosition(frame.lastPosition())
+    
+    def remove_message(self, frame):
+        self.pending.pop(frame, None)
+        self.renderers.pop(frame, None)
+        self.keys.pop(frame, None)
+        if frame not in self.messages:
+            return
+        self.messages.remove(frame)
+        cursor = QTextCursor(self.document())
+        cursor.setPosition(frame.firstPosition() - 1)
+        cursor.setPosition(frame.lastPosition() + 1, QTextCursor.MoveMode.KeepAnchor)
+        cursor.removeSelectedText()
+    
+    def trim(self):
+        """Drop the oldest messages beyond the scrollback limit"""
+        while len(self.messages) > self.max_messages:
+            self.remove_message(self.messages[0])
+    
+    def clear(self):
+        self.pending = {}
+        self.renderers = {}
+        self.keys = {}
+        self.messages = []
+        super().clear()
+
+
+class TabLifecycleManager(QObject):
+    """Puts background tabs to sleep so that many open tabs don't pile up memory.
+    
+    A tab left in the background for `freeze_after` seconds is frozen: its
+    scripts and timers stop, but the page stays in memory. After
+    `discard_after` seconds it is discarded, which frees the page and reloads it
+    when the tab is shown again. With more than `max_live` tabs still loaded,
+    the least recently used are discarded right away (0 means no limit). No tab
+    goes further than Qt's recommendedState, so tabs playing audio or holding
+    unsent form input are left alone.
+    """
+    check_interval_ms = 30000
+    
+    def __init__(self, tab_widget, freeze_after=300, discard_after=3600, max_live=10, parent=None):
+        super().__init__(parent)
+        self.tab_widget = tab_widget
+        self.freeze_after = freeze_after
+        self.discard_after = discard_after
+        self.max_live = max_live
+        self.current = None
+        self.last_used = {}  # tab -> when it was last in front
+        
+        self.timer = QTimer(self)
+        self.timer.setInterval(self.check_interval_ms)
+        self.timer.timeout.connect(self.check)
+        self.timer.start()
+    
+    def activate(self, tab):
+        """Bring a tab's page back to life as it comes to the front"""
+        now = time.monotonic()
+        if self.current is not None and self.current in self.last_used:
+            self.last_used[self.current] = now
+        self.current = tab
+        self.last_used[tab] = now
+        self.set_state(tab, QWebEnginePage.LifecycleState.Active)
+    
+    def forget(self, tab):
+        """Stop tracking a closed tab"""
+        self.last_used.pop(tab, None)
+        if self.current is tab:
+            self.current = None
+    
+    def wake(self, tab):
+        """Unfreeze a tab so its page answers scripts again; returns False for discarded tabs"""
+        if self.state(tab) == QWebEnginePage.LifecycleState.Discarded:
+            return False
+        self.set_state(tab, QWebEnginePage.LifecycleState.Active)
+        return True
+    
+    def state(self, tab):
+        # Placeholder tabs without a web view count as discarded
+        if tab.browser is None:
+            return QWebEnginePage.LifecycleState.Discarded
+        return tab.browser.page().lifecycleState()
+    
+    def set_state(self, tab, state):
+        """Move a tab's page to `state`, or as close to it as Qt recommends, and return the new state"""
+        if tab.browser is None:
+            return QWebEnginePage.LifecycleState.Discarded
+        page = tab.browser.page()
+        recommended = page.recommendedState()
+        if state.value > recommended.value:
+            state = recommended
+        if page.lifecycleState() != state:
+            page.setLifecycleState(state)
+        return state
+    
+    def check(self):
+        """Freeze or discard background tabs that have been idle long enough"""
+        now = time.monotonic()
+        current = self.tab_widget.currentWidget()
+        tabs = [self.tab_widget.widget(i) for i in range(self.tab_widget.count())]
+        background = [tab for tab in tabs if tab is not current and not tab.is_fullscreen]
+        # Most recently used first, so the limit discards the oldest
+        background.sort(key=lambda tab: self.last_used.setdefault(tab, now), reverse=True)
+        
+        live = 1 if current is not None else 0
+        for tab in background:
+            idle = now - self.last_used[tab]
+            if idle >= self.discard_after or (self.max_live and live >= self.max_live):
+                state = QWebEnginePage.LifecycleState.Discarded
+            elif idle >= self.freeze_after:
+                state = QWebEnginePage.LifecycleState.Frozen
+            else:
+                state = QWebEnginePage.LifecycleState.Active
+            # Only ever deeper here: waking a discarded tab would reload it in the background
+            if state.value > self.state(tab).value:
+                state = self.set_state(tab, state)
+            else:
+                state = self.state(tab)
+            if state != QWebEnginePage.LifecycleState.Discarded:
+                live += 1
 
 
 class BrowserTab(QWidget):
-    """Individual browser tab with its own web view"""
-    def __init__(self, url="https://www.google.com", profile=None, parent=None):
+    """Individual browser tab with its own web view.
+    
+    With lazy=True the tab starts out as a cheap placeholder showing `title`,
+    and `browser` stays None until load() creates the web view, which is done
+    the first time the tab is shown. `scroll` is an [x, y] position to return
+    to once the page has loaded.
+    """
+    def __init__(self, url="https://www.google.com", profile=None, parent=None, lazy=False, title="", scroll=None):
         super().__init__(parent)
         self.parent_window = parent
         layout = QVBoxLayout(self)
         layout.setContentsMargins(0, 0, 0, 0)
         
-        self.browser = QWebEngineView()
-        
-        # Use the persistent profile if provided
-        if profile:
-            from PyQt6.QtWebEngineCore import QWebEnginePage
-            page = QWebEnginePage(profile, self.browser)
-            self.browser.setPage(page)
-        
-        self.browser.setUrl(QUrl(url))
-        layout.addWidget(self.browser)
+        self.profile = profile
+        self.url = url
+        self.title = title
+        self.scroll = scroll
+        # Until the page has loaded and been scrolled back, keep the saved position
+        self.scroll_pending = bool(scroll) and any(scroll)
+        self.browser = None
+        self.placeholder = None
         
         # Track fullscreen state
         self.is_fullscreen = False
         self.original_parent = None
         self.original_layout = layout
         
+        if lazy:
+            self.placeholder = QLabel(f"{title or url}\n\nThis tab loads when you open it.")
+            self.placeholder.setAlignment(Qt.AlignmentFlag.AlignCenter)
+            self.placeholder.setStyleSheet("color: #888888;")
+            layout.addWidget(self.placeholder)
+        else:
+            self.load()
+    
+    def load(self):
+        """Create the web view and start loading the page; returns False if it already exists"""
+        if self.browser is not None:
+            return False
+        if self.placeholder is not None:
+            self.original_layout.removeWidget(self.placeholder)
+            self.placeholder.deleteLater()
+            self.placeholder = None
+        
+        self.browser = QWebEngineView()
+        
+        # Use the persistent profile if provided
+        if self.profile:
+            page = QWebEnginePage(self.profile, self.browser)
+            self.browser.setPage(page)
+        
+        self.browser.setUrl(QUrl(self.url))
+        self.original_layout.addWidget(self.browser)
+        
         # Connect fullscreen request handler
         self.browser.page().fullScreenRequested.connect(self.handle_fullscreen_request)
+        return True
+    
+    def current_url(self):
+        return self.browser.url().toString() if self.browser else self.url
+    
+    def current_title(self):
+        return self.browser.page().title() if self.browser else self.title
+    
+    def scroll_position(self):
+        """Scroll position as [x, y], the last known one for unloaded pages"""
+        if self.scroll_pending or self.browser is None:
+            return self.scroll
+        if self.browser.page().lifecycleState() != QWebEnginePage.LifecycleState.Discarded:
+            position = self.browser.page().scrollPosition()
+            self.scroll = [position.x(), position.y()]
+        return self.scroll
     
     def handle_fullscreen_request(self, request):
         """Handle fullscreen requests from web pages (like YouTube)"""
@@ -415,6 +3114,32 @@ class GlitchBrowser(QMainWindow):
         self.setWindowTitle("Glitch Create - AI-Powered Browser")
         self.setGeometry(100, 100, 1400, 900)
         
+        # Settings and the shared Ollama connection
+        self.settings = QSettings()
+        self.ollama = OllamaClient(self.settings.value("ollama/base_url", None))
+        self.ollama_service = OllamaService(self.ollama, self)
+        self.model_registry = ModelRegistry(self.ollama_service, parent=self)
+        self.model_check_id = 0
+        self.model_load_id = 0
+        
+        self.page_extractor = PageExtractor()
+        # How long Compare all tabs waits for slow tabs before going on without them
+        self.tab_extract_timeout_ms = 5000
+        # Pages longer than the context are read in parts and summarized instead of cut off
+        self.long_page_mode = self.settings.value("analysis/long_pages", True, type=bool)
+        self.max_page_chunks = self.settings.value("analysis/max_page_chunks", 24, type=int)
+        self.screenshot_pipeline = ScreenshotPipeline(
+            self.settings.value("vision/format", "JPEG"),
+            self.settings.value("vision/quality", 80, type=int),
+            self.settings.value("vision/max_side", ScreenshotPipeline.default_max_side, type=int)
+        )
+        
+        # How long Ollama keeps a model in memory after a request (duration like "30m", or seconds)
+        self.keep_alive = self.settings.value("ollama/keep_alive", "30m")
+        if isinstance(self.keep_alive, str) and self.keep_alive.lstrip("-").isdigit():
+            self.keep_alive = int(self.keep_alive)
+        self.warmup_on_startup = self.settings.value("ollama/warmup_on_startup", True, type=bool)
+        
         # Create persistent profile for saving login sessions
         try:
             self.setup_persistent_profile()
@@ -422,9 +3147,56 @@ class GlitchBrowser(QMainWindow):
             print(f"Warning: Could not setup persistent profile: {e}")
             self.web_profile = None
         
+        # Earlier AI answers, reused when the same thing is asked again
+        cache_db = os.path.join(self.profile_path, "ai_cache.sqlite") if hasattr(self, 'profile_path') else None
+        self.screenshot_cache = ResultCache(
+            cache_db, "screenshots",
+            max_bytes=self.settings.value("cache/screenshots_mb", 16, type=int) * 1024 * 1024
+        )
+        # Opt-in local index of visited pages, searched when chatting; only opened once turned on
+        self.page_index = None
+        self.index_available = np is not None and hasattr(self, 'profile_path')
+        self.index_enabled = (
+            self.index_available
+            and self.settings.value("index/enabled", False, type=bool)
+            and self.open_page_index()
+        )
+        self.index_results = self.settings.value("index/results", 4, type=int)
+        # How long a page has to stay open before it is indexed
+        self.index_delay_ms = 3000
+        # Size of the pieces pages are indexed in, small enough to point at one topic
+        self.index_chunk_chars = 1200
+        self.index_error_shown = False
+        
+        self.page_cache = ResultCache(
+            cache_db, "page_analyses",
+            max_bytes=self.settings.value("cache/pages_mb", 16, type=int) * 1024 * 1024,
+            ttl=self.settings.value("cache/pages_ttl_hours", 24, type=int) * 3600
+        )
+        
+        # Conversations are saved, so the chat carries on after a restart
+        self.conversation_store = ConversationStore(
+            os.path.join(self.profile_path, "conversations.sqlite") if hasattr(self, 'profile_path') else None
+        )
+        # Messages loaded at a time, at startup and when scrolling back
+        self.history_page_size = self.settings.value("chat/history_page", 50, type=int)
+        self.conversation_id = None
+        
+        # Open tabs and chat state, saved shortly after they change and on exit
+        self.session_path = os.path.join(self.profile_path, "session.json") if hasattr(self, 'profile_path') else None
+        self.session_timer = QTimer(self)
+        self.session_timer.setSingleShot(True)
+        self.session_timer.setInterval(2000)
+        self.session_timer.timeout.connect(self.save_session)
+        
         # Create download manager
         self.download_manager = DownloadManager(self)
         
+        # Model downloads run in the background with their own dialog
+        self.model_downloads = ModelDownloadManager(self.ollama, self)
+        self.model_downloads.model_pulled.connect(self.on_model_pulled)
+        self.model_downloads.pull_failed.connect(self.on_model_pull_failed)
+        
         # Setup download handling
         if self.web_profile:
             self.web_profile.downloadRequested.connect(self.on_download_requested)
@@ -503,6 +3275,16 @@ class GlitchBrowser(QMainWindow):
         self.tab_widget.setMovable(True)
         self.tab_widget.tabCloseRequested.connect(self.close_tab)
         self.tab_widget.currentChanged.connect(self.on_tab_changed)
+        self.tab_widget.tabBar().tabMoved.connect(self.schedule_session_save)
+        
+        # Background tabs are frozen, then unloaded, to keep memory in check
+        self.tab_lifecycle = TabLifecycleManager(
+            self.tab_widget,
+            freeze_after=self.settings.value("tabs/freeze_after_min", 5, type=int) * 60,
+            discard_after=self.settings.value("tabs/discard_after_min", 60, type=int) * 60,
+            max_live=self.settings.value("tabs/max_loaded", 10, type=int),
+            parent=self
+        )
         
         # Splitter for browser and AI chat
         splitter = QSplitter(Qt.Orientation.Horizontal)
@@ -542,25 +3324,53 @@ class GlitchBrowser(QMainWindow):
         self.model_selector.currentTextChanged.connect(self.on_model_changed)
         model_layout.addWidget(self.model_selector)
         
+        self.model_state_label = QLabel("")
+        self.model_state_label.setToolTip("Whether the model is loaded in memory")
+        model_layout.addWidget(self.model_state_label)
+        
         self.current_model = self.model_selector.currentText()
         self.installed_models = []
+        self.model_registry.models_changed.connect(self.on_installed_models_changed)
+        self.model_registry.details_ready.connect(self.on_model_details_ready)
         self.pending_screenshot = False
+        # Full-page capture in progress, only one at a time
+        self.tile_capture = None
         
         self.check_models_btn = QPushButton("Check Models")
         self.check_models_btn.clicked.connect(self.check_available_models)
         model_layout.addWidget(self.check_models_btn)
         
         self.clear_chat_btn = QPushButton("Clear Chat")
-        self.clear_chat_btn.setToolTip("Clear conversation history")
+        self.clear_chat_btn.setToolTip("Start a new conversation (the current one stays under History)")
         self.clear_chat_btn.clicked.connect(self.clear_chat)
         model_layout.addWidget(self.clear_chat_btn)
         
+        self.history_btn = QToolButton()
+        self.history_btn.setText("🕘 History")
+        self.history_btn.setToolTip("Go back to an earlier conversation")
+        self.history_btn.setPopupMode(QToolButton.ToolButtonPopupMode.InstantPopup)
+        history_menu = QMenu(self.history_btn)
+        history_menu.aboutToShow.connect(lambda: self.fill_history_menu(history_menu))
+        self.history_btn.setMenu(history_menu)
+        self.history_btn.setEnabled(bool(self.conversation_store.path))
+        model_layout.addWidget(self.history_btn)
+        
         # Add clear cookies button
         self.clear_cookies_btn = QPushButton("Clear Logins")
         self.clear_cookies_btn.setToolTip("Clear saved login sessions and cookies")
         self.clear_cookies_btn.clicked.connect(self.clear_saved_logins)
         model_layout.addWidget(self.clear_cookies_btn)
         
+        self.index_btn = QPushButton("🧠 Remember Pages")
+        self.index_btn.setCheckable(True)
+        self.index_btn.setChecked(self.index_enabled)
+        self.index_btn.setToolTip("Keep a private, local index of pages you visit so the AI can use them in answers")
+        self.index_btn.toggled.connect(self.toggle_page_index)
+        if not self.index_available:
+            self.index_btn.setEnabled(False)
+            self.index_btn.setToolTip("Remembering pages needs NumPy (pip install numpy) and a saved profile")
+        model_layout.addWidget(self.index_btn)
+        
         model_layout.addStretch()
         chat_layout.addLayout(model_layout)
         
@@ -568,11 +3378,16 @@ class GlitchBrowser(QMainWindow):
         chat_label.setStyleSheet("font-weight: bold; font-size: 14px; padding: 5px;")
         chat_layout.addWidget(chat_label)
         
-        self.chat_display = QTextEdit()
-        self.chat_display.setReadOnly(True)
+        self.chat_display = ChatView(self.settings.value("chat/scrollback", 300, type=int))
         self.chat_display.setStyleSheet("background-color: #ffffff; padding: 10px; color: #000000;")
+        self.chat_display.history_requested.connect(self.load_older_messages)
         chat_layout.addWidget(self.chat_display)
         
+        self.ai_status_label = QLabel("")
+        self.ai_status_label.setStyleSheet("color: #cc0000; padding: 2px 5px;")
+        self.ai_status_label.hide()
+        chat_layout.addWidget(self.ai_status_label)
+        
         # Input area
         input_layout = QHBoxLayout()
         
@@ -586,15 +3401,34 @@ class GlitchBrowser(QMainWindow):
         self.send_btn.clicked.connect(self.send_message)
         input_layout.addWidget(self.send_btn)
         
-        self.page_context_btn = QPushButton("📄 Analyze Page")
+        self.stop_btn = QPushButton("⏹ Stop")
+        self.stop_btn.setFixedWidth(70)
+        self.stop_btn.setToolTip("Stop the AI's answer and drop queued questions")
+        self.stop_btn.setEnabled(False)
+        self.stop_btn.clicked.connect(self.stop_ai)
+        input_layout.addWidget(self.stop_btn)
+        
+        self.page_context_btn = QToolButton()
+        self.page_context_btn.setText("📄 Analyze Page")
         self.page_context_btn.setFixedWidth(130)
+        self.page_context_btn.setPopupMode(QToolButton.ToolButtonPopupMode.MenuButtonPopup)
         self.page_context_btn.clicked.connect(self.analyze_page)
+        page_menu = QMenu(self.page_context_btn)
+        page_menu.addAction("📄 This page", self.analyze_page)
+        page_menu.addAction("🗂 Compare all tabs", self.compare_all_tabs)
+        self.page_context_btn.setMenu(page_menu)
         input_layout.addWidget(self.page_context_btn)
         
-        self.screenshot_btn = QPushButton("📸 See Page")
+        self.screenshot_btn = QToolButton()
+        self.screenshot_btn.setText("📸 See Page")
         self.screenshot_btn.setFixedWidth(110)
         self.screenshot_btn.setToolTip("Take screenshot and let AI see the page (requires vision model)")
-        self.screenshot_btn.clicked.connect(self.analyze_page_with_vision)
+        self.screenshot_btn.setPopupMode(QToolButton.ToolButtonPopupMode.MenuButtonPopup)
+        self.screenshot_btn.clicked.connect(lambda: self.analyze_page_with_vision())
+        screenshot_menu = QMenu(self.screenshot_btn)
+        screenshot_menu.addAction("📸 Visible part", lambda: self.analyze_page_with_vision())
+        screenshot_menu.addAction("🖼 Whole page (scrolls through it)", lambda: self.analyze_page_with_vision(full_page=True))
+        self.screenshot_btn.setMenu(screenshot_menu)
         input_layout.addWidget(self.screenshot_btn)
         
         chat_layout.addLayout(input_layout)
@@ -608,17 +3442,40 @@ class GlitchBrowser(QMainWindow):
         self.chat_visible = True
         self.chat_width = 500
         self.conversation_history = []
+        self.context_manager = ContextManager(self.load_context_budgets())
+        self.chat_engine = ChatEngine(self.load_system_prompts())
         self.worker = None
+        self.ai_status = ""
+        self.analysis_progress = ""
+        
+        # One request at a time unless the server is set up for more
+        max_parallel = os.environ.get("OLLAMA_NUM_PARALLEL") or self.settings.value("ollama/num_parallel", 1)
+        try:
+            max_parallel = int(max_parallel)
+        except (TypeError, ValueError):
+            print(f"Warning: ignoring invalid parallel request limit {max_parallel!r}")
+            max_parallel = 1
+        self.ai_scheduler = AIJobScheduler(max_parallel, self)
+        self.ai_scheduler.queue_changed.connect(self.update_ai_status)
         self.installer = None
         self.home_page = "https://www.google.com"
         self.browser_fullscreen = False
         
-        # Add first tab
-        self.add_new_tab(self.home_page)
+        # Reopen the last session's tabs, or start with the home page
+        session = self.restore_session()
+        if session is None:
+            self.add_new_tab(self.home_page)
         
         # Add keyboard shortcuts
         self.setup_shortcuts()
         
+        # Pick up the last conversation where it was left
+        if self.settings.value("chat/restore", True, type=bool):
+            if session is not None:
+                self.restore_chat(session.get("chat", {}))
+            else:
+                self.open_conversation(self.conversation_store.latest())
+        
         # Welcome message
         self.add_to_chat("System", "🚀 Welcome to Glitch Create - Your AI-Powered Browser!")
         
@@ -627,8 +3484,22 @@ class GlitchBrowser(QMainWindow):
         else:
             self.add_to_chat("AI", f"Hi! I'm a local AI running on your computer with Ollama. I'm completely free and private!\n\nCurrent model: {self.model_selector.currentText()}\n\n📥 File downloads are fully supported!\n⛶ Press F11 for fullscreen mode!\n\nI can help you browse the web and answer questions. Try asking me about the current page or anything else!\n\n✨ New: I can now open websites for you! Just ask me to visit any website and I'll navigate there automatically.")
         
-        # Auto-start Ollama
-        self.auto_start_ollama()
+        # Auto-start Ollama once the window is up, the probe runs in the background
+        QTimer.singleShot(0, self.auto_start_ollama)
+    
+    def closeEvent(self, event):
+        """Stop AI requests and model downloads before the window goes away"""
+        self.save_session()
+        self.ai_scheduler.cancel_all()
+        for job in self.ai_scheduler.running:
+            job['worker'].wait(2000)
+        self.model_downloads.cancel_all()
+        for pull_info in self.model_downloads.pulls:
+            if pull_info['worker']:
+                pull_info['worker'].wait(2000)
+        if self.page_index:
+            self.page_index.close()
+        super().closeEvent(event)
     
     def on_download_requested(self, download):
         """Handle download requests"""
@@ -789,16 +3660,116 @@ class GlitchBrowser(QMainWindow):
         self.tab_widget.setCurrentIndex(index)
         
         # Connect signals after tab is added
+        self.connect_tab(tab)
+        
+        return tab
+    
+    def add_lazy_tab(self, url, title="", scroll=None):
+        """Add a background tab that only loads its page once it is opened"""
+        profile_to_use = self.web_profile if hasattr(self, 'web_profile') and self.web_profile else None
+        tab = BrowserTab(url, profile=profile_to_use, parent=self, lazy=True, title=title, scroll=scroll)
+        self.tab_widget.addTab(tab, "New Tab")
+        self.update_tab_title(tab, title or url)
+        return tab
+    
+    def connect_tab(self, tab):
+        """Hook up a tab's web view once it exists"""
         tab.browser.urlChanged.connect(self.update_url_bar)
+        tab.browser.urlChanged.connect(self.schedule_session_save)
         tab.browser.loadFinished.connect(lambda checked, t=tab: self.on_page_loaded(t))
         tab.browser.titleChanged.connect(lambda title, t=tab: self.update_tab_title(t, title))
-        
-        return tab
     
     def on_page_loaded(self, tab):
         """Called when a page finishes loading"""
         title = tab.browser.page().title()
         self.update_tab_title(tab, title)
+        self.schedule_session_save()
+        
+        if tab.scroll_pending:
+            # Back to where the page was left in the last session
+            tab.scroll_pending = False
+            x, y = tab.scroll
+            tab.browser.page().runJavaScript(f"window.scrollTo({float(x)}, {float(y)});")
+        
+        if self.index_enabled:
+            # Give scripts a moment to fill in the page, and skip pages the user moved on from
+            url = tab.browser.url().toString()
+            QTimer.singleShot(self.index_delay_ms, lambda: self.index_tab(tab, url))
+    
+    def index_tab(self, tab, url):
+        """Add a loaded page to the local index in the background"""
+        if not self.is_tab_open(tab) or tab.browser.url().toString() != url:
+            return
+        if not url.startswith(("http://", "https://")) or self.page_index is None:
+            return
+        page_index = self.page_index
+        
+        def on_extracted(result):
+            data = self.page_extractor.parse(result)
+            if data is None:
+                return
+            title = tab.browser.page().title()
+            chunks = self.page_extractor.chunks(self.page_extractor.full_text(data), self.index_chunk_chars)
+            self.ollama_service.submit(
+                lambda: page_index.index_page(url, title, chunks),
+                lambda count: None,
+                lambda error: self.on_index_failed(page_index, error)
+            )
+        
+        tab.browser.page().runJavaScript(self.page_extractor.script, on_extracted)
+    
+    def on_index_failed(self, page_index, error):
+        print(f"Warning: could not index page: {error}")
+        if not self.index_error_shown:
+            self.index_error_shown = True
+            self.add_to_chat(
+                "System",
+                f"⚠ Could not remember this page: {error}\n"
+                f"Remembering pages needs the embedding model '{page_index.model}' (ollama pull {page_index.model})."
+            )
+    
+    def open_page_index(self):
+        """Open the page index on first use; returns False (with a warning) if it can't be opened"""
+        if self.page_index is not None:
+            return True
+        try:
+            self.page_index = PageIndex(
+                self.ollama,
+                os.path.join(self.profile_path, "page_index"),
+                self.settings.value("index/embed_model", "nomic-embed-text")
+            )
+        except Exception as e:
+            print(f"Warning: could not open the page index, remembering pages is off: {e}")
+            return False
+        return True
+    
+    def toggle_page_index(self, enabled):
+        self.index_error_shown = False
+        if enabled and not self.open_page_index():
+            self.index_enabled = False
+            self.index_btn.blockSignals(True)
+            self.index_btn.setChecked(False)
+            self.index_btn.blockSignals(False)
+            self.add_to_chat("System", "⚠ Could not open the page index on this computer, so pages won't be remembered.")
+            return
+        self.index_enabled = enabled
+        self.settings.setValue("index/enabled", enabled)
+        
+        if not enabled:
+            self.add_to_chat("System", "🧠 Stopped remembering pages. Pages already remembered stay on this computer until you clear logins.")
+            return
+        
+        self.add_to_chat("System", "🧠 Remembering pages you visit. They are indexed on this computer and used to answer your questions.")
+        if self.model_registry.installed() and not self.model_registry.is_installed(self.page_index.model):
+            reply = QMessageBox.question(
+                self,
+                "Embedding Model Required",
+                f"Remembering pages needs the small embedding model '{self.page_index.model}'.\n\n"
+                "Would you like to download it now?",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+            )
+            if reply == QMessageBox.StandardButton.Yes:
+                self.download_model(self.page_index.model)
     
     def update_tab_title(self, tab, title):
         """Update tab title"""
@@ -810,10 +3781,96 @@ class GlitchBrowser(QMainWindow):
                 title = title[:max_length] + "..."
             self.tab_widget.setTabText(index, title if title else "New Tab")
     
+    def schedule_session_save(self, *args):
+        self.session_timer.start()
+    
+    def session_state(self):
+        """Everything needed to reopen the tabs and chat as they are now"""
+        tabs = []
+        for i in range(self.tab_widget.count()):
+            tab = self.tab_widget.widget(i)
+            tabs.append({"url": tab.current_url(), "title": tab.current_title(), "scroll": tab.scroll_position()})
+        return {
+            "version": 1,
+            "tabs": tabs,
+            "current": self.tab_widget.currentIndex(),
+            "chat": {
+                "conversation": self.conversation_id,
+                "draft": self.chat_input.text(),
+                "visible": self.chat_visible,
+                "width": self.chat_width if not self.chat_visible else self.chat_container.width()
+            }
+        }
+    
+    def save_session(self):
+        """Write the session file, replacing the old one only once the new one is complete"""
+        self.session_timer.stop()
+        if not self.session_path:
+            return
+        temp_path = self.session_path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self.session_state(), f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.session_path)
+        except OSError as e:
+            print(f"Warning: could not save the session: {e}")
+    
+    def restore_session(self):
+        """Reopen the last session's tabs as placeholders and return the session, or None.
+        
+        Only the tab that was in front is loaded; the others load when opened.
+        """
+        if not self.session_path or not self.settings.value("session/restore", True, type=bool):
+            return None
+        try:
+            with open(self.session_path, encoding="utf-8") as f:
+                session = json.load(f)
+            entries = [entry for entry in session["tabs"] if entry.get("url")]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            print(f"Warning: could not restore the last session: {e}")
+            return None
+        if not entries:
+            return None
+        
+        # No tab switches while filling in, so no placeholder gets loaded by accident
+        self.tab_widget.blockSignals(True)
+        for entry in entries:
+            scroll = entry.get("scroll")
+            self.add_lazy_tab(entry["url"], entry.get("title", ""), scroll if isinstance(scroll, list) else None)
+        current = session.get("current", 0)
+        self.tab_widget.setCurrentIndex(current if isinstance(current, int) and 0 <= current < len(entries) else 0)
+        self.tab_widget.blockSignals(False)
+        self.on_tab_changed(self.tab_widget.currentIndex())
+        return session
+    
+    def restore_chat(self, chat):
+        """Bring back the session's conversation, unsent message and chat panel"""
+        self.open_conversation(chat.get("conversation"))
+        self.chat_input.setText(chat.get("draft", ""))
+        self.chat_width = chat.get("width") or self.chat_width
+        if chat.get("visible") is False:
+            self.chat_visible = False
+            self.toggle_chat_btn.setText("▶ Show Chat")
+            self.chat_container.setMinimumWidth(0)
+            self.chat_container.setMaximumWidth(0)
+    
+    def is_tab_open(self, tab):
+        """Whether a tab is still open (closed tabs get deleted, so don't touch them)"""
+        return any(self.tab_widget.widget(i) is tab for i in range(self.tab_widget.count()))
+    
     def close_tab(self, index):
         """Close a tab"""
         if self.tab_widget.count() > 1:
+            tab = self.tab_widget.widget(index)
             self.tab_widget.removeTab(index)
+            self.tab_lifecycle.forget(tab)
+            # removeTab only hides the tab; this frees its web view and renderer
+            tab.deleteLater()
+            self.schedule_session_save()
         else:
             # Don't close last tab, just navigate to home
             self.go_home()
@@ -822,7 +3879,13 @@ class GlitchBrowser(QMainWindow):
         """Called when active tab changes"""
         if index >= 0:
             current_tab = self.tab_widget.widget(index)
+            self.ai_scheduler.set_active_tab(current_tab)
             if current_tab:
+                # Restored tabs get their web view the first time they are shown
+                if current_tab.load():
+                    self.connect_tab(current_tab)
+                # Reloads the page if it was discarded
+                self.tab_lifecycle.activate(current_tab)
                 url = current_tab.browser.url().toString()
                 self.url_bar.setText(url)
     
@@ -889,9 +3952,84 @@ class GlitchBrowser(QMainWindow):
         )
         
         if reply == QMessageBox.StandardButton.Yes:
-            self.conversation_history = []
-            self.chat_display.clear()
-            self.add_to_chat("System", "Chat history cleared!")
+            self.stop_ai()
+            self.worker = None
+            self.open_conversation(None)
+            self.add_to_chat("System", "Chat history cleared! The old conversation is still under 🕘 History.")
+    
+    def open_conversation(self, conversation):
+        """Show a saved conversation and continue it, or start a new one with None.
+        
+        Only the newest page of messages is loaded; it becomes the history
+        sent to the model, and older messages are loaded when scrolling up.
+        """
+        self.conversation_id = conversation
+        self.schedule_session_save()
+        self.context_manager.reset()
+        self.chat_display.clear()
+        self.conversation_history = self.conversation_store.messages(
+            conversation, limit=self.history_page_size, full=True
+        )
+        for message in self.conversation_history:
+            self.show_saved_message(message)
+            del message["id"]
+    
+    def show_saved_message(self, message, at_start=False):
+        """Add a saved history message to the chat, page dumps as their one-line stub"""
+        if message["role"] == "assistant":
+            return self.add_to_chat("AI", message["content"], key=message["id"], at_start=at_start)
+        text = message["stub"] if message.get("kind") else message["content"]
+        return self.add_to_chat("You", text, key=message["id"], at_start=at_start)
+    
+    def load_older_messages(self):
+        """Load the page of messages above the oldest one shown, keeping the view in place"""
+        before = self.chat_display.oldest_key()
+        if self.conversation_id is None or before is None:
+            return
+        messages = self.conversation_store.messages(self.conversation_id, before=before, limit=self.history_page_size)
+        if not messages:
+            return
+        
+        scrollbar = self.chat_display.verticalScrollBar()
+        distance = scrollbar.maximum() - scrollbar.value()
+        for message in reversed(messages):
+            self.show_saved_message(message, at_start=True)
+        scrollbar.setValue(scrollbar.maximum() - distance)
+    
+    def fill_history_menu(self, menu):
+        """List recent conversations in the History menu"""
+        menu.clear()
+        conversations = self.conversation_store.conversations()
+        if not conversations:
+            menu.addAction("No saved conversations yet").setEnabled(False)
+        for conversation in conversations:
+            title = conversation["title"] or "Untitled"
+            if len(title) > 50:
+                title = title[:50] + "..."
+            action = menu.addAction(
+                f"{title} ({conversation['count']} messages)",
+                lambda checked=False, conversation=conversation["id"]: self.switch_conversation(conversation)
+            )
+            action.setCheckable(True)
+            action.setChecked(conversation["id"] == self.conversation_id)
+    
+    def switch_conversation(self, conversation):
+        if conversation == self.conversation_id:
+            return
+        self.stop_ai()
+        self.worker = None
+        self.open_conversation(conversation)
+        self.add_to_chat("System", "🕘 Continuing an earlier conversation, scroll up for older messages")
+    
+    def remember(self, message, image_base64=None, frame=None):
+        """Add a message to the conversation and save it, keyed to its chat message"""
+        self.conversation_history.append(message)
+        if self.conversation_id is None:
+            self.conversation_id = self.conversation_store.create()
+            self.schedule_session_save()
+        key = self.conversation_store.append(self.conversation_id, message, image_base64)
+        if frame is not None:
+            self.chat_display.set_key(frame, key)
     
     def clear_saved_logins(self):
         """Clear all saved cookies and login sessions"""
@@ -918,11 +4056,22 @@ class GlitchBrowser(QMainWindow):
                 
                 # Also delete the persistent storage directory
                 if hasattr(self, 'profile_path') and os.path.exists(self.profile_path):
+                    # The page index keeps its vector file open
+                    if self.page_index:
+                        self.page_index.close()
+                        self.page_index = None
                     try:
                         shutil.rmtree(self.profile_path)
                         os.makedirs(self.profile_path, exist_ok=True)
                     except Exception as e:
                         print(f"Could not delete profile directory: {e}")
+                    # Saved conversations went with it; the chat goes on as a new one
+                    self.conversation_id = None
+                    if self.index_enabled and not self.open_page_index():
+                        self.index_enabled = False
+                        self.index_btn.blockSignals(True)
+                        self.index_btn.setChecked(False)
+                        self.index_btn.blockSignals(False)
                 
                 self.add_to_chat("System", "✓ All saved logins and cookies cleared!")
                 QMessageBox.information(
@@ -974,14 +4123,18 @@ class GlitchBrowser(QMainWindow):
     
     def auto_start_ollama(self):
         """Automatically start Ollama if not running"""
-        try:
-            response = requests.get("http://localhost:11434/api/tags", timeout=2)
-            if response.status_code == 200:
-                self.add_to_chat("System", "✓ Connected to Ollama successfully!")
-                self.check_and_download_model()
-                return
-        except:
-            pass
+        self.model_registry.refresh(True, self.on_ollama_detected, self.on_ollama_not_detected, retries=0)
+    
+    def on_ollama_detected(self, models):
+        """Ollama answered the start-up probe"""
+        self.add_to_chat("System", "✓ Connected to Ollama successfully!")
+        self.on_installed_models_checked(models)
+    
+    def on_ollama_not_detected(self, error):
+        """Ollama did not answer the start-up probe, try to start it"""
+        if not self.ollama.is_local():
+            self.add_to_chat("System", f"⚠ Cannot reach the Ollama server at {self.ollama.base_url}")
+            return
         
         # Try to start Ollama automatically
         self.add_to_chat("System", "🔄 Ollama not detected. Attempting to start...")
@@ -1016,15 +4169,13 @@ class GlitchBrowser(QMainWindow):
     
     def check_ollama_after_start(self):
         """Check if Ollama started successfully"""
-        try:
-            response = requests.get("http://localhost:11434/api/tags", timeout=2)
-            if response.status_code == 200:
-                self.add_to_chat("System", "✓ Ollama started successfully!")
-                self.check_and_download_model()
-                return
-        except:
-            pass
-        
+        self.model_registry.refresh(True, self.on_ollama_started, self.on_ollama_start_failed)
+    
+    def on_ollama_started(self, models):
+        self.add_to_chat("System", "✓ Ollama started successfully!")
+        self.on_installed_models_checked(models)
+    
+    def on_ollama_start_failed(self, error):
         self.add_to_chat("System", "⚠ Could not start Ollama automatically.")
         self.offer_ollama_installation()
     
@@ -1070,152 +4221,226 @@ class GlitchBrowser(QMainWindow):
             self.add_to_chat("System", "✓ " + message)
             QMessageBox.information(self, "Success", message + "\n\nOllama is now running!")
             
-            import time
-            time.sleep(3)
-            self.check_and_download_model()
+            QTimer.singleShot(3000, self.check_and_download_model)
         else:
             self.add_to_chat("System", "✗ " + message)
             QMessageBox.warning(self, "Installation Failed", message)
     
+    def on_installed_models_changed(self, names):
+        """The model registry saw models being added or removed"""
+        self.installed_models = names
+    
+    def on_model_details_ready(self, model_name):
+        """Cap the chat budget at the model's real context length"""
+        details = self.model_registry.get_details(model_name)
+        if details and details["context_length"]:
+            self.context_manager.limit_budget(model_name, details["context_length"])
+    
     def check_and_download_model(self):
         """Check if any models are installed, if not download one"""
-        try:
-            response = requests.get("http://localhost:11434/api/tags", timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                models = data.get("models", [])
-                self.installed_models = [model["name"] for model in models]
-                
-                if not models:
-                    reply = QMessageBox.question(
-                        self,
-                        "No Models Found",
-                        "No AI models are installed yet.\n\n"
-                        "Would you like to download llama3.2:1b? (Small, fast model ~1.3GB)\n\n"
-                        "This will take a few minutes depending on your internet speed.",
-                        QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
-                    )
-                    
-                    if reply == QMessageBox.StandardButton.Yes:
-                        self.download_model("llama3.2:1b")
-                else:
-                    self.add_to_chat("System", f"Found {len(models)} installed model(s): {', '.join(self.installed_models)}")
-        except:
-            pass
+        self.model_registry.refresh(True, self.on_installed_models_checked)
+    
+    def on_installed_models_checked(self, models):
+        """Offer a first model download when none are installed"""
+        
+        if not models:
+            reply = QMessageBox.question(
+                self,
+                "No Models Found",
+                "No AI models are installed yet.\n\n"
+                "Would you like to download llama3.2:1b? (Small, fast model ~1.3GB)\n\n"
+                "This will take a few minutes depending on your internet speed.",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+            )
+            
+            if reply == QMessageBox.StandardButton.Yes:
+                self.download_model("llama3.2:1b")
+        else:
+            names = [model["name"] for model in models]
+            self.add_to_chat("System", f"Found {len(models)} installed model(s): {', '.join(names)}")
+            
+            if self.warmup_on_startup and self.model_registry.is_installed(self.current_model):
+                self.warm_up_model(self.current_model)
     
     def on_model_changed(self, model_name):
         """Handle model selection change"""
         if not model_name:
             return
         
-        try:
-            response = requests.get("http://localhost:11434/api/tags", timeout=2)
-            if response.status_code != 200:
-                self.add_to_chat("System", "⚠ Cannot connect to Ollama. Make sure it's running.")
-                self.model_selector.setCurrentText(self.current_model)
-                return
-            
-            data = response.json()
-            installed = [model["name"] for model in data.get("models", [])]
-            self.installed_models = installed
+        # Only the newest selection counts if the user scrolls through the list
+        self.model_check_id += 1
+        check_id = self.model_check_id
+        # Usually answered straight from the model registry's cache
+        self.model_registry.refresh(
+            False,
+            lambda models: self.on_model_check_result(model_name, check_id),
+            lambda error: self.on_model_check_failed(check_id, error),
+            retries=0
+        )
+    
+    def on_model_check_result(self, model_name, check_id):
+        """Switch to the selected model, or offer to download it"""
+        if check_id != self.model_check_id:
+            return
+        
+        if self.model_registry.is_installed(model_name):
+            self.set_current_model(model_name)
+            self.add_to_chat("System", f"✓ Switched to model: {model_name}")
             
-            model_installed = any(model_name in model or model in model_name for model in installed)
+            if self.pending_screenshot:
+                full_page = self.pending_screenshot == "full"
+                self.pending_screenshot = False
+                self.analyze_page_with_vision(full_page=full_page)
+        else:
+            reply = QMessageBox.question(
+                self,
+                "Model Not Installed",
+                f"The model '{model_name}' is not installed.\n\n"
+                f"Would you like to download it now?\n\n"
+                f"Note: This may take several minutes depending on the model size and your internet speed.",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+            )
             
-            if model_installed:
-                self.current_model = model_name
-                self.add_to_chat("System", f"✓ Switched to model: {model_name}")
-                
-                if self.pending_screenshot:
-                    self.pending_screenshot = False
-                    self.take_and_analyze_screenshot()
+            if reply == QMessageBox.StandardButton.Yes:
+                # current_model switches over once the download has finished
+                self.download_model(model_name)
             else:
-                reply = QMessageBox.question(
-                    self,
-                    "Model Not Installed",
-                    f"The model '{model_name}' is not installed.\n\n"
-                    f"Would you like to download it now?\n\n"
-                    f"Note: This may take several minutes depending on the model size and your internet speed.",
-                    QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
-                )
-                
-                if reply == QMessageBox.StandardButton.Yes:
-                    self.download_model(model_name)
-                    self.current_model = model_name
-                else:
-                    self.add_to_chat("System", f"Keeping current model: {self.current_model}")
-                    self.model_selector.setCurrentText(self.current_model)
-        
-        except Exception as e:
-            self.add_to_chat("System", f"Error checking model: {str(e)}")
-            self.model_selector.setCurrentText(self.current_model)
+                self.add_to_chat("System", f"Keeping current model: {self.current_model}")
+                self.model_selector.setCurrentText(self.current_model)
     
-    def download_model(self, model_name):
-        """Download an Ollama model"""
-        self.add_to_chat("System", f"📥 Downloading model '{model_name}'... This may take a few minutes.")
+    def set_current_model(self, model_name):
+        """Make a model current, loading it and unloading the previous one in the background"""
+        previous = self.current_model
+        self.current_model = model_name
         
-        self.download_progress = QProgressDialog(
-            f"Downloading {model_name}...\n\nThis may take several minutes.", 
-            None, 0, 0, self
+        if self.model_registry.resolve(previous) != self.model_registry.resolve(model_name):
+            self.warm_up_model(model_name, unload=previous)
+    
+    def warm_up_model(self, model_name, unload=None):
+        """Load a model ahead of the first prompt so it doesn't pay the load time"""
+        if unload and not self.model_registry.is_installed(unload):
+            unload = None
+        
+        self.model_load_id += 1
+        load_id = self.model_load_id
+        self.model_state_label.setText("⏳ Loading...")
+        self.model_state_label.setStyleSheet("color: #aa7700;")
+        
+        self.ollama_service.load_model(
+            model_name,
+            self.keep_alive,
+            unload=unload,
+            on_result=lambda seconds: self.on_model_loaded(load_id, model_name, seconds),
+            on_error=lambda error: self.on_model_load_failed(load_id, model_name, error),
+            num_ctx=self.context_manager.context_size(model_name)
         )
-        self.download_progress.setWindowTitle("Downloading Model")
-        self.download_progress.setWindowModality(Qt.WindowModality.WindowModal)
-        self.download_progress.setCancelButton(None)
-        self.download_progress.show()
+    
+    def on_model_loaded(self, load_id, model_name, seconds):
+        if load_id != self.model_load_id:
+            return
+        self.model_state_label.setText("● Ready")
+        self.model_state_label.setStyleSheet("color: #2d5016;")
+        self.add_to_chat("System", f"✓ {model_name} is loaded ({seconds:.1f}s)")
+    
+    def on_model_load_failed(self, load_id, model_name, error):
+        if load_id != self.model_load_id:
+            return
+        self.model_state_label.setText("○ Not loaded")
+        self.model_state_label.setStyleSheet("color: #cc0000;")
+        self.add_to_chat("System", f"⚠ Could not load {model_name}: {error}")
+    
+    def on_model_check_failed(self, check_id, error):
+        if check_id != self.model_check_id:
+            return
         
-        try:
-            if platform.system() == "Windows":
-                process = subprocess.Popen(
-                    ["ollama", "pull", model_name],
-                    creationflags=subprocess.CREATE_NO_WINDOW,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True
-                )
-            else:
-                process = subprocess.Popen(
-                    ["ollama", "pull", model_name],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True
-                )
-            
-            stdout, stderr = process.communicate()
+        self.add_to_chat("System", "⚠ Cannot connect to Ollama. Make sure it's running.")
+        self.model_selector.setCurrentText(self.current_model)
+    
+    def download_model(self, model_name):
+        """Queue an Ollama model download, browsing continues while it runs"""
+        if self.model_downloads.queue_pull(model_name):
+            self.add_to_chat("System", f"📥 Downloading model '{model_name}'... You can keep browsing, progress is shown in the Model Downloads window.")
+        self.show_model_downloads()
+    
+    def show_model_downloads(self):
+        """Show the model download dialog"""
+        self.model_downloads.show()
+        self.model_downloads.raise_()
+    
+    def on_model_pulled(self, model_name):
+        """A queued model download finished"""
+        self.add_to_chat("System", f"✓ Model '{model_name}' downloaded successfully! You can start chatting now.")
+        if self.model_selector.currentText() == model_name:
+            self.set_current_model(model_name)
+        
+        self.model_registry.refresh(
+            True,
+            lambda models: self.after_model_pulled(model_name, models),
+            lambda error: self.add_to_chat("System", f"Error checking models: {error}")
+        )
+    
+    def after_model_pulled(self, model_name, models):
+        """Continue with the new model once the registry knows about it"""
+        self.on_available_models(models)
+        
+        if self.pending_screenshot and self.current_model == model_name:
+            full_page = self.pending_screenshot == "full"
+            self.pending_screenshot = False
+            self.add_to_chat("System", "Now taking screenshot with the new vision model...")
+            self.analyze_page_with_vision(full_page=full_page)
+    
+    def on_model_pull_failed(self, model_name, message):
+        self.add_to_chat("System", f"✗ Failed to download model '{model_name}': {message}")
+        if self.pending_screenshot and self.model_selector.currentText() == model_name:
+            self.pending_screenshot = False
+        if self.model_selector.currentText() == model_name:
+            self.model_selector.setCurrentText(self.current_model)
+    
+    def check_available_models(self):
+        self.model_registry.refresh(
+            True,
+            self.on_available_models,
+            lambda error: self.add_to_chat("System", f"Error checking models: {error}")
+        )
+    
+    def on_available_models(self, models):
+        models = [model["name"] for model in models]
+        if models:
+            self.add_to_chat("System", f"Available models: {', '.join(models)}")
             
-            self.download_progress.close()
+            # Repopulate without switching models, unless the current one is gone
+            current = self.current_model
+            self.model_selector.blockSignals(True)
+            self.model_selector.clear()
+            self.model_selector.addItems(models)
+            for name in (current, f"{current}:latest"):
+                if name in models:
+                    self.model_selector.setCurrentText(name)
+                    self.current_model = name
+                    break
+            self.model_selector.blockSignals(False)
             
-            if process.returncode == 0:
-                self.add_to_chat("System", f"✓ Model '{model_name}' downloaded successfully! You can start chatting now.")
-                self.check_available_models()
-                
-                if self.pending_screenshot:
-                    self.pending_screenshot = False
-                    self.add_to_chat("System", "Now taking screenshot with the new vision model...")
-                    self.take_and_analyze_screenshot()
-            else:
-                self.add_to_chat("System", f"✗ Failed to download model: {stderr}")
-                
-        except Exception as e:
-            self.download_progress.close()
-            self.add_to_chat("System", f"✗ Failed to download model: {str(e)}")
+            if self.model_selector.currentText() != self.current_model:
+                self.on_model_changed(self.model_selector.currentText())
+        else:
+            self.add_to_chat("System", "No models installed. Install one with: ollama pull llama3.2")
     
-    def check_available_models(self):
-        try:
-            response = requests.get("http://localhost:11434/api/tags", timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                models = [model["name"] for model in data.get("models", [])]
-                if models:
-                    self.add_to_chat("System", f"Available models: {', '.join(models)}")
-                    self.model_selector.clear()
-                    self.model_selector.addItems(models)
-                else:
-                    self.add_to_chat("System", "No models installed. Install one with: ollama pull llama3.2")
-            else:
-                self.add_to_chat("System", "Failed to fetch models from Ollama")
-        except Exception as e:
-            self.add_to_chat("System", f"Error checking models: {str(e)}")
+    def add_to_chat(self, sender, message, key=None, at_start=False):
+        """Show a message in the chat and return its frame"""
+        if sender == "AI":
+            # Replies are Markdown
+            frame = self.chat_display.add_message(self.format_sender(sender), markdown=True, key=key, at_start=at_start)
+            self.chat_display.append_text(frame, message)
+            self.chat_display.finish_message(frame)
+            return frame
+        
+        formatted_message = MarkdownRenderer.escape(message).replace("\n", "<br>")
+        return self.chat_display.add_message(
+            f'{self.format_sender(sender)} {formatted_message}', key=key, at_start=at_start
+        )
     
-    def add_to_chat(self, sender, message):
+    def format_sender(self, sender):
+        """Return the coloured sender label used in front of chat messages"""
         if sender == "You":
             color = "#0066cc"
         elif sender == "AI":
@@ -1223,11 +4448,7 @@ class GlitchBrowser(QMainWindow):
         else:
             color = "#cc0000"
         
-        formatted_message = message.replace("\n", "<br>")
-        self.chat_display.append(f'<span style="color: {color}; font-weight: bold;">{sender}:</span> {formatted_message}<br>')
-        
-        scrollbar = self.chat_display.verticalScrollBar()
-        scrollbar.setValue(scrollbar.maximum())
+        return f'<span style="color: {color}; font-weight: bold;">{sender}:</span>'
     
     def send_message(self):
         user_message = self.chat_input.text().strip()
@@ -1235,50 +4456,115 @@ class GlitchBrowser(QMainWindow):
             return
         
         self.chat_input.clear()
-        self.add_to_chat("You", user_message)
-        
-        # Add system context about browser control capabilities
-        enhanced_message = user_message
+        frame = self.add_to_chat("You", user_message)
+        
+        # Browser control instructions travel in the system prompt (see ChatEngine)
+        if not self.index_enabled or self.page_index is None:
+            self.get_ai_response({
+                "role": "user",
+                "content": user_message,
+                "frame": frame
+            })
+            return
         
-        # Only add the system prompt on the first message or if conversation is short
-        if len(self.conversation_history) == 0:
-            system_context = """[SYSTEM CAPABILITY: You can control the browser! When you want to open a website, use this format: [OPEN_URL: https://example.com]. 
-You can also naturally suggest websites by saying things like "I'll open https://example.com for you" or "Let me navigate to https://wikipedia.org" and the browser will automatically open them.
-Be helpful and proactively open relevant websites when users ask for them.]
-
-"""
-            enhanced_message = system_context + user_message
+        # Look up related pages from browsing history first; if that fails, just ask
+        page_index = self.page_index
+        self.ollama_service.submit(
+            lambda: page_index.search(user_message, self.index_results),
+            lambda results: self.send_with_history(user_message, results, frame),
+            lambda error: self.send_with_history(user_message, [], frame)
+        )
+    
+    def send_with_history(self, user_message, results, frame=None):
+        """Ask the AI with the most relevant remembered page snippets attached"""
+        if not results:
+            self.get_ai_response({"role": "user", "content": user_message, "frame": frame})
+            return
         
-        self.conversation_history.append({
+        snippets = "\n\n".join(
+            f"({i + 1}) {result['title']} - {result['url']}\n{result['text']}" for i, result in enumerate(results)
+        )
+        self.get_ai_response({
             "role": "user",
-            "content": enhanced_message
+            "content": f"[Snippets from pages I visited earlier, use them if they help:\n\n{snippets}]\n\n{user_message}",
+            # Old snippets are dropped first when the conversation gets long
+            "kind": "page",
+            "stub": user_message,
+            "frame": frame
         })
-        
-        self.get_ai_response()
     
-    def analyze_page_with_vision(self):
+    def analyze_page_with_vision(self, details_checked=False, full_page=False, registry_checked=False):
         """Take a screenshot and have AI analyze the visual content"""
-        vision_models = ["llava", "bakllava", "llava-phi3", "llama3.2-vision"]
-        supports_vision = any(vm in self.current_model.lower() for vm in vision_models)
+        supports_vision = self.model_registry.supports_vision(self.current_model)
+        installed = self.model_registry.is_installed(self.current_model)
+        
+        if supports_vision is None and not installed and not registry_checked:
+            # The model list may just not be loaded yet, so look before deciding
+            self.model_registry.refresh(
+                force=True,
+                on_result=lambda models: self.analyze_page_with_vision(full_page=full_page, registry_checked=True),
+                on_error=lambda error: self.add_to_chat(
+                    "System", "⚠ Can't reach Ollama to check whether the model can see screenshots. "
+                              "Make sure Ollama is running!\n\nStart it with: ollama serve"
+                )
+            )
+            return
+        
+        if supports_vision is None and not details_checked and installed:
+            # Capabilities not known yet, look them up and come back
+            self.model_registry.fetch_details(
+                self.current_model,
+                lambda details: self.analyze_page_with_vision(details_checked=True, full_page=full_page),
+                lambda error: self.add_to_chat("System", f"Error checking model: {error}")
+            )
+            return
         
         if not supports_vision:
+            # Prefer a vision model that is already installed over a new download
+            installed_vision = self.model_registry.vision_models()
+            suggestion = installed_vision[0] if installed_vision else "llama3.2-vision:11b"
+            note = "(Already installed)" if installed_vision else "(This model can see and analyze screenshots)"
+            
+            if not installed and suggestion == self.current_model:
+                # The selected model is the right one, it just isn't there yet
+                reply = QMessageBox.question(
+                    self,
+                    "Vision Model Required",
+                    f"The current model '{self.current_model}' can see screenshots but is not installed.\n\n"
+                    "Would you like to download it now?",
+                    QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+                )
+                if reply == QMessageBox.StandardButton.Yes:
+                    self.pending_screenshot = "full" if full_page else "visible"
+                    self.download_model(self.current_model)
+                return
+            
+            if installed:
+                problem = f"The current model '{self.current_model}' doesn't support vision."
+            else:
+                problem = f"The current model '{self.current_model}' is not installed."
             reply = QMessageBox.question(
                 self,
                 "Vision Model Required",
-                f"The current model '{self.current_model}' doesn't support vision.\n\n"
-                "Would you like to switch to llama3.2-vision:11b?\n"
-                "(This model can see and analyze screenshots)",
+                f"{problem}\n\n"
+                f"Would you like to switch to {suggestion}?\n"
+                f"{note}",
                 QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
             )
             
             if reply == QMessageBox.StandardButton.Yes:
-                self.pending_screenshot = True
-                self.model_selector.setCurrentText("llama3.2-vision:11b")
+                self.pending_screenshot = "full" if full_page else "visible"
+                if self.model_selector.findText(suggestion) < 0:
+                    self.model_selector.addItem(suggestion)
+                self.model_selector.setCurrentText(suggestion)
                 return
             else:
                 return
         
-        self.take_and_analyze_screenshot()
+        if full_page:
+            self.take_full_page_screenshot()
+        else:
+            self.take_and_analyze_screenshot()
     
     def take_and_analyze_screenshot(self):
         """Actually take the screenshot and send to AI"""
@@ -1286,114 +4572,558 @@ Be helpful and proactively open relevant websites when users ask for them.]
         if not browser:
             return
         
-        self.add_to_chat("You", "📸 Taking screenshot of page...")
+        # Don't encode an image the model would silently drop
+        if not self.model_registry.supports_vision(self.current_model):
+            self.add_to_chat("System", f"⚠ The model '{self.current_model}' can't see screenshots.")
+            return
         
-        size = browser.size()
-        image = QImage(size, QImage.Format.Format_ARGB32)
-        painter = QPainter(image)
-        browser.render(painter)
-        painter.end()
+        self.add_to_chat("You", "📸 Taking screenshot of page...")
         
-        buffer = QBuffer()
-        buffer.open(QBuffer.OpenModeFlag.WriteOnly)
-        image.save(buffer, "PNG")
-        image_data = buffer.data()
-        image_base64 = base64.b64encode(image_data).decode('utf-8')
+        image = self.screenshot_pipeline.grab(browser)
+        max_side = self.screenshot_pipeline.target_side(self.model_registry.get_details(self.current_model))
         
         current_url = browser.url().toString()
         current_title = browser.page().title()
         
         message = f"I'm viewing this webpage:\n\nURL: {current_url}\nTitle: {current_title}\n\nPlease analyze what you see in this screenshot. Describe the page layout, content, images, and any important information visible."
+        digest = self.model_registry.digest(self.current_model) or self.current_model
         
-        self.conversation_history.append({
-            "role": "user",
-            "content": message
-        })
+        def prepare():
+            # An unchanged page with the same model and prompt gets the earlier answer
+            key = ResultCache.make_key(
+                current_url, self.screenshot_pipeline.perceptual_hash(image), digest, message
+            )
+            cached = self.screenshot_cache.get(key)
+            if cached is not None:
+                return key, None, cached
+            return key, self.screenshot_pipeline.encode(image, max_side), None
+        
+        def send(prepared):
+            key, image_base64, cached = prepared
+            self.get_ai_response({
+                "role": "user",
+                "content": message,
+                "kind": "screenshot",
+                "stub": f"[Earlier screenshot of {current_title} ({current_url}) omitted]",
+                "cache": (self.screenshot_cache, key),
+                "cached_reply": cached
+            }, image_base64=image_base64)
+        
+        # Hashing, the cache lookup, scaling and encoding happen off the GUI thread
+        self.ollama_service.submit(
+            prepare,
+            send,
+            lambda error: self.add_to_chat("System", f"⚠ Could not capture the page: {error}")
+        )
+    
+    def take_full_page_screenshot(self):
+        """Capture the whole page as tiles and have the AI describe all of it"""
+        browser = self.get_current_browser()
+        if not browser:
+            return
+        
+        if not self.model_registry.supports_vision(self.current_model):
+            self.add_to_chat("System", f"⚠ The model '{self.current_model}' can't see screenshots.")
+            return
+        
+        if self.tile_capture is not None:
+            self.add_to_chat("System", "🖼 Already capturing a page, wait for it to finish.")
+            return
+        
+        self.add_to_chat("You", "🖼 Taking screenshots of the whole page...")
+        
+        current_url = browser.url().toString()
+        current_title = browser.page().title()
+        
+        # Stop scrolling and grabbing as soon as the tab is closed or left
+        tab = self.tab_widget.currentWidget()
+        capture = PageTileCapture(
+            browser, self.screenshot_pipeline, lambda: self.tab_widget.currentWidget() is tab, self
+        )
+        capture.finished.connect(
+            lambda tiles: self.on_page_tiles_captured(capture, tiles, current_url, current_title)
+        )
+        capture.failed.connect(lambda error: self.on_page_capture_failed(capture, error))
+        self.tile_capture = capture
+        capture.start()
+    
+    def on_page_capture_failed(self, capture, error):
+        self.tile_capture = None
+        capture.deleteLater()
+        self.add_to_chat("System", f"⚠ Could not capture the page: {error}")
+    
+    def on_page_tiles_captured(self, capture, tiles, url, title):
+        """Encode the captured tiles in the background, then analyze them"""
+        self.tile_capture = None
+        capture.deleteLater()
+        skipped = capture.skipped
+        sampled = capture.sampled
+        note = f" ({skipped} duplicate frame(s) skipped)" if skipped else ""
+        if sampled:
+            note += ". The page is too long to capture all of it, so these are spread evenly over it"
+        self.add_to_chat("System", f"🖼 Captured {len(tiles)} part(s) of the page{note}")
+        
+        max_side = self.screenshot_pipeline.target_side(self.model_registry.get_details(self.current_model))
+        self.ollama_service.submit(
+            lambda: [self.screenshot_pipeline.encode(tile, max_side) for tile in tiles],
+            lambda encoded: self.analyze_page_tiles(encoded, url, title, sampled),
+            lambda error: self.add_to_chat("System", f"⚠ Could not capture the page: {error}")
+        )
+    
+    def analyze_page_tiles(self, encoded, url, title, sampled=False):
+        """Describe each tile on its own, then merge the descriptions in the chat"""
+        stub = f"[Earlier full-page screenshots of {title} ({url}) omitted]"
+        
+        if len(encoded) == 1:
+            message = f"I'm viewing this webpage:\n\nURL: {url}\nTitle: {title}\n\nPlease analyze what you see in this screenshot. Describe the page layout, content, images, and any important information visible."
+            self.get_ai_response({"role": "user", "content": message, "kind": "screenshot", "stub": stub}, image_base64=encoded[0])
+            return
         
-        self.get_ai_response(image_base64=image_base64)
+        total = len(encoded)
+        order = "sampled evenly from top to bottom" if sampled else "captured from top to bottom"
+        parts = []
+        for index, image_base64 in enumerate(encoded):
+            prompt = (f"This is part {index + 1} of {total} of a screenshot of the webpage {title} ({url}), "
+                      f"{order}. Describe the layout, text, images and any important "
+                      "information visible in this part.")
+            parts.append(([{"role": "user", "content": prompt}], image_base64))
+        
+        def merge(results):
+            descriptions = "\n\n".join(f"Part {i + 1}: {result}" for i, result in enumerate(results))
+            if sampled:
+                coverage = (f"The page is too long to capture all of it, so I took {total} screenshots spread "
+                            "evenly from top to bottom; the parts between them are not shown. ")
+            else:
+                coverage = f"I captured the whole page as {total} screenshots from top to bottom. "
+            message = (f"I'm viewing this webpage:\n\nURL: {url}\nTitle: {title}\n\n"
+                       f"{coverage}"
+                       f"Here is what each part shows:\n\n{descriptions}\n\n"
+                       "Please combine these into one description of the page: its layout, content, "
+                       "images, and any important information.")
+            self.get_ai_response({"role": "user", "content": message, "kind": "screenshot", "stub": stub})
+        
+        self.run_map_reduce(parts, "Analyzing page part", merge)
+    
+    def run_map_reduce(self, parts, label, on_done):
+        """Run one request per part in the background and pass the answers to on_done"""
+        analysis = MapReduceAnalysis(
+            self.ai_scheduler, self.ollama, self.current_model, parts,
+            keep_alive=self.keep_alive, tab=self.tab_widget.currentWidget(),
+            num_ctx=self.context_manager.context_size(self.current_model), parent=self
+        )
+        
+        def on_progress(done, total):
+            self.analysis_progress = f"{label} {done}/{total}..."
+            self.update_ai_status()
+        
+        def on_finished(results):
+            self.analysis_progress = ""
+            self.update_ai_status()
+            analysis.deleteLater()
+            on_done(results)
+        
+        def on_cancelled():
+            self.analysis_progress = ""
+            self.add_to_chat("System", "⏹ Stopped the page analysis")
+            self.update_ai_status()
+            analysis.deleteLater()
+        
+        analysis.progress.connect(on_progress)
+        analysis.finished.connect(on_finished)
+        analysis.cancelled.connect(on_cancelled)
+        analysis.start()
     
     def analyze_page(self):
         browser = self.get_current_browser()
         if browser:
+            browser.page().runJavaScript(
+                self.page_extractor.script,
+                lambda result: self.on_page_extracted(browser, result)
+            )
+    
+    def on_page_extracted(self, browser, result):
+        """Send the page's main content, or fall back to its plain text"""
+        if browser is not self.get_current_browser():
+            return
+        
+        data = self.page_extractor.parse(result)
+        if data is None:
             browser.page().toPlainText(self.on_page_content_received)
+            return
+        
+        max_chars = self.context_manager.page_chars(self.current_model)
+        full_text = self.page_extractor.full_text(data)
+        if self.long_page_mode and len(full_text) > max_chars:
+            self.analyze_long_page(browser.url().toString(), browser.page().title(), full_text)
+        else:
+            self.send_page_analysis(browser, self.page_extractor.format(data, max_chars))
     
     def on_page_content_received(self, content):
         browser = self.get_current_browser()
         if not browser:
             return
         
+        max_chars = self.context_manager.page_chars(self.current_model)
+        if self.long_page_mode and len(content) > max_chars:
+            self.analyze_long_page(browser.url().toString(), browser.page().title(), content)
+        else:
+            self.send_page_analysis(browser, self.page_extractor.format_text(content, max_chars))
+    
+    def analyze_long_page(self, current_url, current_title, text, rounds=0, key=None):
+        """Summarize a page that doesn't fit the context in parts, then answer from the summaries.
+        
+        Takes the page's URL and title rather than its web view, since the tab
+        may be closed while the parts are being read.
+        """
+        max_chars = self.context_manager.page_chars(self.current_model)
+        stub = f"[Earlier page content of {current_title} ({current_url}) omitted]"
+        
+        if key is None:
+            key = self.page_cache_key(current_url, text, self.page_extractor.long_prompt)
+            cached = self.page_cache.get(key)
+            if cached is not None:
+                # The part summaries aren't kept, so the turn just records what was asked
+                self.add_to_chat("You", "📄 Analyzing current page...")
+                self.get_ai_response({
+                    "role": "user",
+                    "content": self.page_extractor.long_prompt.format(
+                        url=current_url, title=current_title, content="(read earlier)"
+                    ),
+                    "kind": "page",
+                    "stub": stub,
+                    "cached_reply": cached
+                })
+                return
+        
+        chunks = self.page_extractor.chunks(text, max_chars)
+        if len(chunks) > self.max_page_chunks:
+            self.add_to_chat("System", f"⚠ This page is very long, only the first {self.max_page_chunks} parts will be read")
+            chunks = chunks[:self.max_page_chunks]
+        
+        if rounds == 0:
+            self.add_to_chat("You", f"📄 Analyzing current page (long page, reading it in {len(chunks)} parts)...")
+        
+        parts = []
+        for index, chunk in enumerate(chunks):
+            if rounds == 0:
+                prompt = (f"This is part {index + 1} of {len(chunks)} of the webpage {current_title} ({current_url}). "
+                          "Summarize the key information in this part: main points, facts, figures and names. "
+                          f"Be concise.\n\n{chunk}")
+            else:
+                prompt = f"Condense these summaries of parts of the webpage {current_title} into one shorter summary, keeping the key information:\n\n{chunk}"
+            parts.append(([{"role": "user", "content": prompt}], None))
+        
+        def reduce(summaries):
+            combined = "\n\n".join(f"Part {i + 1}: {summary}" for i, summary in enumerate(summaries))
+            
+            # Summaries that still don't fit get condensed again, a bounded number of times
+            if len(combined) > max_chars and rounds < 2:
+                self.analyze_long_page(current_url, current_title, combined, rounds + 1, key)
+                return
+            
+            combined = self.page_extractor.format_text(combined, max_chars)
+            self.add_to_chat("System", "📚 Read all parts of the page, putting it together...")
+            self.get_ai_response({
+                "role": "user",
+                "content": self.page_extractor.long_prompt.format(url=current_url, title=current_title, content=combined),
+                "kind": "page",
+                "stub": stub,
+                "cache": (self.page_cache, key)
+            })
+        
+        self.run_map_reduce(parts, "Reading page part", reduce)
+    
+    def page_cache_key(self, url, text, template):
+        """Cache key for an analysis of this page text with the current model and prompt"""
+        content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        digest = self.model_registry.digest(self.current_model) or self.current_model
+        return ResultCache.make_key(url, content_hash, digest, template)
+    
+    def send_page_analysis(self, browser, content):
         current_url = browser.url().toString()
         current_title = browser.page().title()
         
-        max_content_length = 6000
-        if len(content) > max_content_length:
-            content = content[:max_content_length] + "\n\n...(content truncated for length)"
-        
-        message = f"I'm currently viewing this webpage:\n\nURL: {current_url}\nTitle: {current_title}\n\nPage content:\n{content}\n\nPlease analyze this page and tell me what it's about, including key information and main topics."
+        message = self.page_extractor.prompt.format(url=current_url, title=current_title, content=content)
+        key = self.page_cache_key(current_url, content, self.page_extractor.prompt)
         
         self.add_to_chat("You", "📄 Analyzing current page...")
         
-        self.conversation_history.append({
+        self.get_ai_response({
             "role": "user",
-            "content": message
+            "content": message,
+            "kind": "page",
+            "stub": f"[Earlier page content of {current_title} ({current_url}) omitted]",
+            "cache": (self.page_cache, key),
+            "cached_reply": self.page_cache.get(key)
         })
+    
+    def compare_all_tabs(self):
+        """Summarize every open web page and have the AI compare them"""
+        tabs = [self.tab_widget.widget(i) for i in range(self.tab_widget.count())]
+        tabs = [tab for tab in tabs if tab.current_url().startswith(("http://", "https://"))]
+        # Frozen tabs are woken up to be read; unloaded ones would all have to reload
+        awake = [tab for tab in tabs if self.tab_lifecycle.wake(tab)]
+        unloaded = len(tabs) - len(awake)
+        tabs = awake
+        if len(tabs) < 2:
+            self.add_to_chat("System", "Open at least two web pages in tabs to compare them.")
+            return
+        
+        self.add_to_chat("You", f"🗂 Comparing {len(tabs)} open tabs...")
+        if unloaded:
+            self.add_to_chat("System", f"💤 Left out {unloaded} tab(s) that were unloaded to save memory; open them to include them.")
+        max_chars = self.context_manager.page_chars(self.current_model)
+        pages = [None] * len(tabs)
+        state = {'waiting': len(tabs), 'done': False}
+        
+        def collected(index, content):
+            if state['done'] or pages[index] is not None:
+                return
+            pages[index] = content
+            state['waiting'] -= 1
+            if state['waiting'] == 0:
+                finish()
+        
+        def on_extracted(index, result):
+            if not self.is_tab_open(tabs[index]):
+                collected(index, "")
+                return
+            data = self.page_extractor.parse(result)
+            if data is None:
+                tabs[index].browser.page().toPlainText(
+                    lambda text: collected(index, self.page_extractor.format_text(text, max_chars))
+                )
+            else:
+                collected(index, self.page_extractor.format(data, max_chars))
+        
+        def finish():
+            # Tabs that never answered (crashed or still busy) are left out
+            state['done'] = True
+            ready = [(tab, content) for tab, content in zip(tabs, pages) if content and self.is_tab_open(tab)]
+            if not ready:
+                self.add_to_chat("System", "⚠ Could not read any of the open tabs.")
+                return
+            self.summarize_tabs(ready)
         
-        self.get_ai_response()
+        # All tabs are read at the same time
+        for index, tab in enumerate(tabs):
+            tab.browser.page().runJavaScript(
+                self.page_extractor.script,
+                lambda result, index=index: on_extracted(index, result)
+            )
+        QTimer.singleShot(self.tab_extract_timeout_ms, lambda: None if state['done'] else finish())
+    
+    def summarize_tabs(self, pages):
+        """Summarize each tab in parallel, then ask for one comparison"""
+        titles = [(tab.browser.page().title(), tab.browser.url().toString()) for tab, _ in pages]
+        parts = []
+        for (title, url), (_, content) in zip(titles, pages):
+            prompt = (f"Summarize this webpage for a side-by-side comparison with other pages: "
+                      f"its topic, main points, key facts and figures, and any conclusions.\n\n"
+                      f"URL: {url}\nTitle: {title}\n\nPage content:\n{content}")
+            parts.append(([{"role": "user", "content": prompt}], None))
+        
+        def compare(summaries):
+            combined = "\n\n".join(
+                f"Tab {i + 1}: {title} ({url})\n{summary}" for i, ((title, url), summary) in enumerate(zip(titles, summaries))
+            )
+            combined = self.page_extractor.format_text(combined, self.context_manager.page_chars(self.current_model))
+            self.get_ai_response({
+                "role": "user",
+                "content": f"I have these {len(titles)} webpages open in tabs. Summaries of each:\n\n{combined}\n\n"
+                           "Please compare them: what each is about, where they agree or differ, "
+                           "and which is most useful for what.",
+                "kind": "page",
+                "stub": f"[Earlier comparison of {len(titles)} tabs omitted]"
+            })
+        
+        self.run_map_reduce(parts, "Summarizing tab", compare)
+    
+    def load_context_budgets(self):
+        """Per-model context sizes in tokens from the settings' [context] group, keyed by model name prefix"""
+        budgets = {}
+        self.settings.beginGroup("context")
+        for key in self.settings.childKeys():
+            try:
+                budgets[key] = int(self.settings.value(key))
+            except (TypeError, ValueError):
+                print(f"Warning: ignoring context size for {key}: {self.settings.value(key)!r}")
+        self.settings.endGroup()
+        return budgets
+    
+    def load_system_prompts(self):
+        """Per-model system prompts from the settings' [prompts] group, keyed by model name prefix"""
+        self.settings.beginGroup("prompts")
+        prompts = {key: self.settings.value(key) for key in self.settings.childKeys()}
+        self.settings.endGroup()
+        return prompts
     
-    def get_ai_response(self, image_base64=None):
-        self.chat_input.setEnabled(False)
-        self.send_btn.setEnabled(False)
-        self.page_context_btn.setEnabled(False)
-        self.screenshot_btn.setEnabled(False)
+    def get_ai_response(self, message, image_base64=None):
+        """Queue a user message for the AI.
+        
+        The message joins the conversation when the job starts, so follow-ups
+        typed while the AI is still answering keep their place in the order.
+        """
+        self.ai_scheduler.submit(
+            lambda: self.start_chat_job(message, image_base64),
+            priority=AIJobScheduler.PRIORITY_CHAT,
+            group="chat",
+            tab=self.tab_widget.currentWidget(),
+            on_cancel=lambda: self.on_chat_dropped(message)
+        )
+    
+    def on_chat_dropped(self, message):
+        """A queued message was stopped before it was sent; say so in the chat"""
+        frame = message.get("frame")
+        if frame is not None:
+            self.chat_display.append_text(frame, " [not sent]")
+        else:
+            self.add_to_chat("System", "⏹ Dropped a queued request before it was sent")
+    
+    def start_chat_job(self, message, image_base64):
+        """Build the request for a queued chat message (called by the scheduler)"""
+        selected_model = self.current_model
+        
+        system_prompt = self.chat_engine.system_prompt(selected_model)
+        cached_reply = message.pop("cached_reply", None)
+        self.remember(message, image_base64, message.pop("frame", None))
+        
+        if cached_reply is not None:
+            frame = self.add_to_chat("AI", cached_reply)
+            self.add_to_chat("System", "⚡ Nothing changed since the last time, so this is the earlier answer")
+            self.remember({"role": "assistant", "content": cached_reply}, frame=frame)
+            return None
+        
+        messages, summary_job = self.context_manager.build(self.conversation_history, selected_model, system_prompt)
+        if summary_job:
+            self.start_summary(summary_job, selected_model)
+        
+        # Reserve the AI message's place in the chat; messages added while it
+        # streams go below it
+        self.ai_message = self.chat_display.add_message(self.format_sender("AI"), markdown=True)
+        self.ai_message_started = False
         
         if image_base64:
-            self.add_to_chat("System", "AI is analyzing the screenshot...")
+            self.ai_status = "AI is analyzing the screenshot..."
         else:
-            self.add_to_chat("System", "AI is thinking...")
-        
-        selected_model = self.current_model
+            self.ai_status = "AI is thinking..."
         
-        self.worker = OllamaWorker(self.conversation_history, selected_model, image_base64)
+        self.worker = OllamaWorker(
+            self.ollama, messages, selected_model, image_base64, keep_alive=self.keep_alive, system=system_prompt,
+            num_ctx=self.context_manager.context_size(selected_model)
+        )
+        self.worker.streaming.connect(self.on_ai_stream)
         self.worker.finished.connect(self.on_ai_response)
         self.worker.error.connect(self.on_ai_error)
-        self.worker.start()
+        self.worker.cancelled.connect(self.on_ai_cancelled)
+        self.worker.cache = message.get("cache")
+        return self.worker
+    
+    def start_summary(self, summary_job, model):
+        """Summarize turns that no longer fit the context window in the background"""
+        def start():
+            worker = OllamaWorker(
+                self.ollama, summary_job["messages"], model, stream=False, keep_alive=self.keep_alive,
+                num_ctx=self.context_manager.context_size(model)
+            )
+            worker.finished.connect(
+                lambda summary: self.context_manager.set_summary(summary, summary_job["version"])
+            )
+            return worker
+        
+        self.ai_scheduler.submit(start, priority=AIJobScheduler.PRIORITY_BACKGROUND)
+    
+    def stop_ai(self):
+        """Cancel the running and queued requests the user is waiting on"""
+        self.ai_scheduler.cancel_foreground()
+    
+    def update_ai_status(self):
+        """Show what the AI is doing below the chat"""
+        queued = len([job for job in self.ai_scheduler.queue if job['group'] == "chat"])
+        running = self.ai_scheduler.pending("chat") - queued
+        
+        if running:
+            status = self.ai_status
+            if queued:
+                status += f" ({queued} more queued)"
+            self.ai_status_label.setText(status)
+            self.ai_status_label.show()
+        elif self.analysis_progress:
+            self.ai_status_label.setText(self.analysis_progress)
+            self.ai_status_label.show()
+        else:
+            self.ai_status_label.hide()
+        
+        foreground = [job for job in self.ai_scheduler.queue + self.ai_scheduler.running
+                      if job['priority'] == AIJobScheduler.PRIORITY_CHAT]
+        self.stop_btn.setEnabled(bool(foreground))
+    
+    def insert_ai_text(self, text):
+        """Add text to the end of the in-progress AI message"""
+        self.chat_display.append_text(self.ai_message, text)
+    
+    def on_ai_stream(self, text):
+        """Append a batch of streamed text to the in-progress AI message"""
+        if self.sender() is not self.worker:
+            return
+        
+        self.ai_message_started = True
+        self.insert_ai_text(text)
+    
+    def end_ai_message(self, text=""):
+        """Close off the in-progress AI message, adding text if nothing was streamed"""
+        if text:
+            self.insert_ai_text(text)
+        self.chat_display.finish_message(self.ai_message)
+    
+    def remove_ai_message(self):
+        """Take the reserved (still empty) AI message out of the chat"""
+        self.chat_display.remove_message(self.ai_message)
     
     def on_ai_response(self, assistant_message):
-        cursor = self.chat_display.textCursor()
-        cursor.movePosition(cursor.MoveOperation.End)
-        cursor.select(cursor.SelectionType.BlockUnderCursor)
-        cursor.removeSelectedText()
-        cursor.deletePreviousChar()
+        if self.sender() is not self.worker:
+            return
         
-        self.conversation_history.append({
+        # Streamed text is already on screen, otherwise show the whole reply now
+        self.end_ai_message("" if self.ai_message_started else assistant_message)
+        
+        self.remember({
             "role": "assistant",
             "content": assistant_message
-        })
+        }, frame=self.ai_message)
+        
+        if self.worker.cache:
+            cache, key = self.worker.cache
+            cache.put(key, assistant_message)
         
         # Check if AI wants to open a URL
         self.check_and_handle_url_commands(assistant_message)
-        
-        self.add_to_chat("AI", assistant_message)
-        
-        self.chat_input.setEnabled(True)
-        self.send_btn.setEnabled(True)
-        self.page_context_btn.setEnabled(True)
-        self.screenshot_btn.setEnabled(True)
-        self.chat_input.setFocus()
     
     def on_ai_error(self, error_message):
-        cursor = self.chat_display.textCursor()
-        cursor.movePosition(cursor.MoveOperation.End)
-        cursor.select(cursor.SelectionType.BlockUnderCursor)
-        cursor.removeSelectedText()
-        cursor.deletePreviousChar()
+        if self.sender() is not self.worker:
+            return
+        
+        if self.ai_message_started:
+            self.end_ai_message()
+        else:
+            self.remove_ai_message()
         
         self.add_to_chat("System", error_message)
+    
+    def on_ai_cancelled(self, partial_message):
+        if self.sender() is not self.worker:
+            return
         
-        self.chat_input.setEnabled(True)
-        self.send_btn.setEnabled(True)
-        self.page_context_btn.setEnabled(True)
-        self.screenshot_btn.setEnabled(True)
+        if self.ai_message_started:
+            self.end_ai_message(" [stopped]")
+            # Keep what was shown, so the conversation matches the chat
+            self.remember({
+                "role": "assistant",
+                "content": partial_message
+            }, frame=self.ai_message)
+        else:
+            self.remove_ai_message()
+            self.add_to_chat("System", "⏹ Stopped")
     
     def check_and_handle_url_commands(self, message):
         """Check if AI message contains URL commands and handle them"""
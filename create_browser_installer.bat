@@ -82,6 +82,9 @@ echo.
 echo Installing requests...
 pip install requests
 echo.
+echo Installing numpy (used to remember visited pages)...
+pip install numpy
+echo.
 
 if %errorlevel% equ 0 (
     echo.